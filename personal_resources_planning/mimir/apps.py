@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class MimirConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mimir'
+
+    def ready(self):
+        if settings.MIMIR_WARM_UP_MODEL:
+            from mimir.model_provider import modelProvider
+            modelProvider.warmUp()
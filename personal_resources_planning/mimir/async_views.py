@@ -0,0 +1,167 @@
+import functools
+from asgiref.sync import sync_to_async
+from rest_framework import status
+from rest_framework.exceptions import MethodNotAllowed
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from mimir import views
+from mimir.model_provider import modelProvider
+from mimir.tree_cache import bumpTreeGeneration, cachedKnowledgeTree
+from mimir.serializers import DueCardsQuerySerializer, KnowledgeSubtreeSerializer, KnowledgeTreeQuerySerializer, \
+    ReviewSerializer, SyncQuerySerializer
+from mimir.models import Card, Category
+
+# Async versions of the mimir views for ASGI deployments (MIMIR_ASYNC_VIEWS). Reads use the async ORM, serializer
+# validation and writes go through sync_to_async and training runs in the training worker, so one event loop keeps
+# serving requests while a retrain is running. Requests and responses go through the same DRF machinery as the ones
+# of the DRF views.
+
+class _AsyncApiView(APIView):
+    # Does for an async view what APIView.dispatch does around a handler: parsing, authentication, permissions,
+    # throttling and content negotiation as configured in REST_FRAMEWORK, and the same exception handling.
+    # Like the DRF views, every view requires an authenticated user.
+    permission_classes = [IsAuthenticated]
+
+    def initialRequest(self, request, *args, **kwargs):
+        # Returns the DRF request and, when the view must not run (e.g. OPTIONS or failed authentication), the
+        # response to send instead.
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            self.initial(request, *args, **kwargs)
+            if request.method.lower() not in self.http_method_names:
+                raise MethodNotAllowed(request.method)
+            if request.method == 'OPTIONS':
+                return request, self.renderedResponse(self.options(request, *args, **kwargs))
+            # Parse the body here, as the view reads request.data on the event loop.
+            request.data
+        except Exception as exc:
+            return request, self.renderedResponse(self.handle_exception(exc))
+        return request, None
+
+    def renderedResponse(self, response):
+        return self.finalize_response(self.request, response, *self.args, **self.kwargs).render()
+
+def _asyncApiView(methods):
+    # DRF's @api_view cannot wrap coroutines; this is its counterpart running the DRF request handling in a thread.
+    def decorator(view):
+        handler = lambda self, *args, **kwargs: None # Only tells APIView which methods are allowed
+        viewClass = type(view.__name__, (_AsyncApiView,), {
+            '__doc__': view.__doc__,
+            'http_method_names': [method.lower() for method in methods] + ['options'],
+            **{method.lower(): handler for method in methods}
+        })
+
+        @functools.wraps(view)
+        async def apiView(request, *args, **kwargs):
+            apiViewInstance = viewClass()
+            request, response = await sync_to_async(apiViewInstance.initialRequest)(request, *args, **kwargs)
+            if response is not None:
+                return response
+            try:
+                response = await view(request, *args, **kwargs)
+            except Exception as exc:
+                response = await sync_to_async(apiViewInstance.handle_exception)(exc)
+            return await sync_to_async(apiViewInstance.renderedResponse)(response)
+
+        apiView.csrf_exempt = True
+        return apiView
+    return decorator
+
+# Only the I/O differs from the DRF views: lookups use the async ORM and everything else runs the same helpers of
+# mimir.views, in a thread when it queries.
+
+@_asyncApiView(['GET'])
+async def buildKnowledgeTree(request):
+    if views._isSubtreeQuery(request.query_params):
+        return await _buildKnowledgeSubtree(request)
+
+    etag, data = await sync_to_async(cachedKnowledgeTree)()
+    if views._matchesETag(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return Response(data, headers={'ETag': etag})
+
+async def _buildKnowledgeSubtree(request):
+    query = views._validated(KnowledgeTreeQuerySerializer(data=request.query_params))
+    try:
+        category = await views._subtreeNodes().aget(id=query.get('node'))
+    except Category.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    serializer = KnowledgeSubtreeSerializer(category, context=query)
+    # The serializer queries the children and cards while rendering.
+    return Response(await sync_to_async(lambda: serializer.data)())
+
+@_asyncApiView(['POST'])
+async def createCard(request):
+    return await sync_to_async(views._createCard)(request.data)
+
+@_asyncApiView(['GET', 'PUT', 'DELETE'])
+async def updateOrDeleteCard(request, card_id):
+    try:
+        card = await Card.objects.aget(id=card_id)
+    except Card.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    return await sync_to_async(views._cardDetail)(request, card)
+
+@_asyncApiView(['POST'])
+async def createCategory(request):
+    return await sync_to_async(views._createCategory)(request.data)
+
+@_asyncApiView(['PUT', 'DELETE'])
+async def updateOrDeleteCategory(request, category_id):
+    try:
+        category = await Category.objects.aget(id=category_id)
+    except Category.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    return await sync_to_async(views._categoryDetail)(request, category)
+
+async def _applyReviews(cards, actualGrades):
+    nn = await sync_to_async(modelProvider.neuralNetwork)()
+    cases = await sync_to_async(views._recordReviews)(nn, cards, actualGrades)
+    await sync_to_async(bumpTreeGeneration)()
+    await modelProvider.trainingWorker().aenqueue(cases)
+
+@_asyncApiView(['POST'])
+async def reviewCard(request):
+    review = views._validated(ReviewSerializer(data=request.data))
+    try:
+        card = await Card.objects.aget(id=review.get('cardId'))
+    except Card.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    await _applyReviews([card], [review.get('actualGrade')])
+    return Response(status=status.HTTP_200_OK)
+
+@_asyncApiView(['POST'])
+async def reviewCards(request):
+    cardIds, actualGrades = views._reviewBatch(request.data)
+    cards = await Card.objects.ain_bulk(cardIds)
+    missing = views._missingCardsResponse(cardIds, cards)
+    if missing is not None:
+        return missing
+
+    await _applyReviews([cards[cardId] for cardId in cardIds], actualGrades)
+    return Response(status=status.HTTP_200_OK)
+
+@_asyncApiView(['GET'])
+async def dueCards(request):
+    query = views._validated(DueCardsQuerySerializer(data=request.query_params))
+    category = None
+    if 'category' in query:
+        try:
+            category = await Category.objects.aget(id=query.get('category'))
+        except Category.DoesNotExist:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+    limit = query.get('limit')
+    page = [card async for card in views._dueCards(category, query.get('cursor'))[:limit + 1]]
+    return Response(views._duePage(page, limit))
+
+@_asyncApiView(['GET'])
+async def sync(request):
+    query = views._validated(SyncQuerySerializer(data=request.query_params))
+    return Response(await sync_to_async(views._changesSince)(query.get('since')))
@@ -0,0 +1,119 @@
+import csv
+import json
+from datetime import date, timedelta
+from django.db import transaction
+from rest_framework import serializers
+from rest_framework.utils.encoders import JSONEncoder
+from mimir.models import Card, CardType, Category
+from mimir.serializers import CardSerializer, CategoryNodeSerializer
+
+
+def readRows(lines, format):
+    # Yields (line number, row) from NDJSON or CSV (with a header line) text lines.
+    if format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, {field: value for field, value in row.items() if value != ''}
+        return
+
+    for lineNumber, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield lineNumber, None
+            continue
+        # Category records of an export are skipped; only cards are imported.
+        if not isinstance(row, dict) or row.get('type', 'card') == 'card':
+            yield lineNumber, row
+
+
+def importCards(rows, nn, chunkSize = 1000):
+    # Validates and inserts cards chunk by chunk. Returns the number of created cards and a list of
+    # {'line', 'errors'} for the rows that were skipped.
+    created = 0
+    errors = []
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunkSize:
+            created += _importChunk(chunk, nn, errors)
+            chunk = []
+    if chunk:
+        created += _importChunk(chunk, nn, errors)
+    errors.sort(key=lambda error: error['line'])
+    return created, errors
+
+
+def _importChunk(chunk, nn, errors):
+    # category and cardType are resolved for the whole chunk with in_bulk rather than one query per row and field,
+    # the remaining fields are validated by CardSerializer.
+    serializer = CardSerializer()
+    del serializer.fields['category']
+    del serializer.fields['cardType']
+
+    # Null fields (e.g. the back of an exported card) are treated as omitted.
+    rows = [(lineNumber, {field: value for field, value in row.items() if value is not None})
+            for lineNumber, row in chunk if isinstance(row, dict)]
+    errors.extend({'line': lineNumber, 'errors': {'non_field_errors': ['Invalid row.']}}
+                  for lineNumber, row in chunk if not isinstance(row, dict))
+    categories = Category.objects.in_bulk([row['category'] for _, row in rows if _isId(row.get('category'))])
+    cardTypes = CardType.objects.in_bulk([row['cardType'] for _, row in rows if isinstance(row.get('cardType'), str)])
+
+    validRows = []
+    for lineNumber, row in rows:
+        rowErrors = {}
+        try:
+            validatedData = serializer.run_validation(row)
+        except serializers.ValidationError as error:
+            rowErrors.update(error.detail)
+
+        category = categories.get(int(row['category'])) if _isId(row.get('category')) else None
+        if category is None:
+            rowErrors['category'] = ['Unknown category.']
+        cardType = cardTypes.get(row.get('cardType'))
+        if cardType is None:
+            rowErrors['cardType'] = ['Unknown card type.']
+
+        if rowErrors:
+            errors.append({'line': lineNumber, 'errors': rowErrors})
+        else:
+            validRows.append({**validatedData, 'category': category, 'cardType': cardType})
+
+    if not validRows:
+        return 0
+
+    # New cards are scheduled like createCard does, from the default inputs (0, 0, 0, 0).
+    zeros = [0] * len(validRows)
+    predictedIntervals = nn.predictNextIntervals(zeros, zeros, zeros, zeros).tolist()
+    today = date.today()
+    with transaction.atomic():
+        Card.objects.bulk_create([
+            Card(lastPredictedInterval=0,
+                 reviewInterval=0,
+                 repetition=0,
+                 predictedInterval=predictedInterval,
+                 nextReviewOn=today + timedelta(days=predictedInterval),
+                 **validatedData)
+            for validatedData, predictedInterval in zip(validRows, predictedIntervals)])
+    return len(validRows)
+
+
+def _isId(value):
+    return (isinstance(value, int) and not isinstance(value, bool)) or (isinstance(value, str) and value.isdigit())
+
+
+def exportLines(chunkSize = 2000):
+    # Yields every category, then every card, as NDJSON lines without loading the tables into memory.
+    categorySerializer = CategoryNodeSerializer()
+    for category in Category.objects.order_by('id').iterator(chunk_size=chunkSize):
+        yield _jsonLine('category', categorySerializer.to_representation(category))
+
+    cardSerializer = CardSerializer()
+    for card in Card.objects.order_by('id').iterator(chunk_size=chunkSize):
+        yield _jsonLine('card', cardSerializer.to_representation(card))
+
+
+def _jsonLine(type, data):
+    return json.dumps({'type': type, **data}, cls=JSONEncoder, ensure_ascii=False) + '\n'
@@ -0,0 +1,240 @@
+import json
+import random
+import time
+import numpy as np
+from datetime import date, timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+from mimir.model_provider import modelProvider
+from mimir.model_sync import modelGeneration
+from mimir.models import Card, Category
+from mimir.neural_network import NeuralNetwork
+from mimir.tree_cache import bumpTreeGeneration
+
+# Options shaping the workload; results are only comparable with a baseline measured with the same ones.
+WORKLOAD_OPTIONS = ('repeat', 'training_sizes', 'full_training_sizes', 'full_training_repeat', 'categories', 'cards',
+                    'delete_size', 'seed')
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the scheduling network and the API hot paths on a throwaway test database (in memory for SQLite) '
+            'filled with a synthetic knowledge tree, optionally comparing the results with a saved baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200, help='Measured runs per benchmark.')
+        parser.add_argument('--training-sizes', type=int, nargs='+', default=[100, 1000, 10000],
+                            help='Numbers of cases an _onlineTraining epoch is benchmarked on.')
+        parser.add_argument('--full-training-sizes', type=int, nargs='+', default=[100],
+                            help='Numbers of cases a whole _onlineTraining run is benchmarked on.')
+        parser.add_argument('--full-training-repeat', type=int, default=3, help='Measured whole training runs per size.')
+        parser.add_argument('--categories', type=int, default=200, help='Categories of the synthetic tree.')
+        parser.add_argument('--cards', type=int, default=2000, help='Cards of the synthetic tree.')
+        parser.add_argument('--delete-size', type=int, default=50,
+                            help='Categories of each subtree removed by the cascade delete benchmark.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--save', help='Write the results to this JSON file (e.g. to use as a baseline).')
+        parser.add_argument('--baseline', help='Compare the results with a JSON file written by --save '
+                                                   '(mimir/benchmark_baseline.json holds one with the default options).')
+        parser.add_argument('--threshold', type=float, default=1.25,
+                            help='Report a regression when a median is this many times the baseline median.')
+        parser.add_argument('--min-difference', type=float, default=0.05,
+                            help='Ignore medians less than this many milliseconds above the baseline median, which '
+                                 'are within the timer noise of the fastest benchmarks.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as error:
+                raise CommandError(f'Cannot read baseline: {error}')
+            baselineOptions = baseline.get('options', {})
+            different = [key for key in WORKLOAD_OPTIONS if baselineOptions.get(key) != options[key]]
+            if different:
+                raise CommandError('The baseline was measured with other options: ' + ', '.join(
+                    f'--{key.replace("_", "-")} {baselineOptions.get(key)}' for key in different))
+
+        self.repeat = options['repeat']
+        self.random = random.Random(options['seed'])
+        np.random.seed(options['seed'])
+        self.results = {}
+
+        # Checkpoints saved here must not make the running workers reload from the real database.
+        generationPath = modelGeneration._path
+        modelGeneration._path = None
+        setup_test_environment()
+        databaseName = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            call_command('loaddata', 'initial', 'neural_network_weight', verbosity=0)
+            self._benchmarkNetwork(options['training_sizes'], options['full_training_sizes'],
+                                   options['full_training_repeat'])
+            self._benchmarkApi(options['categories'], options['cards'], options['delete_size'])
+        finally:
+            connection.creation.destroy_test_db(databaseName, verbosity=0)
+            teardown_test_environment()
+            modelGeneration._path = generationPath
+
+        self._report(baseline, options['threshold'], options['min_difference'])
+        if options['save']:
+            with open(options['save'], 'w') as file:
+                json.dump({'options': {key: options[key] for key in WORKLOAD_OPTIONS},
+                           'results': self.results}, file, indent=2)
+
+        if baseline is not None and self.regressions:
+            raise CommandError(f'{len(self.regressions)} benchmark(s) regressed: {", ".join(self.regressions)}')
+
+    def _measure(self, name, run, setup = None, repeat = None):
+        timings = []
+        queries = []
+        for _ in range(repeat or self.repeat):
+            if setup is not None:
+                setup()
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(context.captured_queries))
+
+        p50, p90, p99 = np.percentile(timings, [50, 90, 99])
+        self.results[name] = {'runs': len(timings), 'p50': p50, 'p90': p90, 'p99': p99, 'mean': float(np.mean(timings)),
+                              'queries': int(np.median(queries))}
+        self.stdout.write(f'{name:<45} {p50:>10.3f} {p90:>10.3f} {p99:>10.3f} {self.results[name]["queries"]:>8}')
+
+    def _benchmarkNetwork(self, trainingSizes, fullTrainingSizes, fullTrainingRepeat):
+        self.stdout.write(f'{"benchmark (ms)":<45} {"p50":>10} {"p90":>10} {"p99":>10} {"queries":>8}')
+        nn = NeuralNetwork(trainingMode=settings.MIMIR_TRAINING_MODE, batchSize=settings.MIMIR_TRAINING_BATCH_SIZE)
+
+        self._measure('predictNextInterval (memoized)', lambda: nn.predictNextInterval(0, 0, 0, 0))
+        inputs = ()
+        def nextInputs():
+            nonlocal inputs
+            # A fresh snapshot per run, so every prediction evaluates the network.
+            nn._snapshotWeights()
+            inputs = (self.random.randint(0, 2048), self.random.randint(0, 2048), self.random.randint(0, 128),
+                      self.random.randint(0, 5))
+        self._measure('predictNextInterval', lambda: nn.predictNextInterval(*inputs), setup=nextInputs)
+
+        batch = [np.random.randint(0, 2049, 1000), np.random.randint(0, 2049, 1000), np.random.randint(0, 129, 1000),
+                 np.random.randint(0, 6, 1000)]
+        self._measure('predictNextIntervals x1000', lambda: nn.predictNextIntervals(*batch), setup=nn._snapshotWeights)
+
+        # One epoch over the cases (targetRMSE is always reached), including the checkpoint save that ends a run.
+        for size in trainingSizes:
+            cases = np.random.random_sample((size, 5))
+            def loadCases():
+                nn._userCases = cases.copy()
+            self._measure(f'_onlineTraining epoch, {size} cases', lambda: nn._onlineTraining(targetRMSE=float('inf')),
+                          setup=loadCases, repeat=max(1, min(self.repeat, 200_000 // size)))
+
+        # Whole runs with the default stopping rule, as after a review. Random cases never reach targetRMSE, so this
+        # is the worst case of epochFactor * cases.size epochs.
+        for size in fullTrainingSizes:
+            cases = np.random.random_sample((size, 5))
+            def loadCases():
+                nn._userCases = cases.copy()
+            self._measure(f'_onlineTraining run, {size} cases', nn._onlineTraining, setup=loadCases,
+                          repeat=fullTrainingRepeat)
+
+        self._measure('_saveWeights', nn._saveWeights)
+        self._measure('_restoreWeights', nn._restoreWeights)
+
+    def _benchmarkApi(self, categories, cards, deleteSize):
+        root = Category.objects.get(id=1)
+        self._buildTree(root, categories, cards)
+        nn = NeuralNetwork(trainingMode=settings.MIMIR_TRAINING_MODE, batchSize=settings.MIMIR_TRAINING_BATCH_SIZE)
+        trainingWorker = _DeferredTraining()
+        servingNetwork = modelProvider.use(nn, trainingWorker)
+        try:
+            self._benchmarkRequests(nn, trainingWorker, root, deleteSize, deleteSize * cards // max(categories, 1))
+        finally:
+            modelProvider.use(*servingNetwork)
+
+    def _benchmarkRequests(self, nn, trainingWorker, root, deleteSize, deleteCards):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='benchmark'))
+
+        self._measure('GET /knowledgeTree (cold)', lambda: client.get('/mimir/knowledgeTree'), setup=bumpTreeGeneration)
+        self._measure('GET /knowledgeTree (cached)', lambda: client.get('/mimir/knowledgeTree'))
+        self._measure('GET /knowledgeTree?depth=1&cardLimit=20',
+                      lambda: client.get('/mimir/knowledgeTree', {'depth': 1, 'cardLimit': 20}))
+
+        cardIds = list(Card.objects.values_list('id', flat=True))
+        review = {}
+        def nextReview():
+            review.update(cardId=self.random.choice(cardIds), actualGrade=self.random.randint(0, 5))
+        self._measure('POST /review (without retraining)', lambda: client.post('/mimir/review', review, format='json'),
+                      setup=nextReview)
+        reviews = []
+        def nextReviews():
+            reviews[:] = [{'cardId': cardId, 'actualGrade': self.random.randint(0, 5)} for cardId in self.random.sample(cardIds, 100)]
+        self._measure('POST /review/batch x100 (without retraining)',
+                      lambda: client.post('/mimir/review/batch', reviews, format='json'), setup=nextReviews,
+                      repeat=max(1, self.repeat // 10))
+        self._measure('retraining after reviews', lambda: nn.learnFromCases(trainingWorker.drain()), repeat=1)
+
+        subtree = {}
+        def nextSubtree():
+            subtree['root'] = self._buildTree(root, deleteSize, deleteCards)
+        self._measure(f'DELETE /category ({deleteSize} categories)',
+                      lambda: client.delete(f'/mimir/category/{subtree["root"].id}'), setup=nextSubtree,
+                      repeat=max(1, self.repeat // 10))
+
+    def _buildTree(self, parent, categories, cards):
+        # Random tree of categories (each one under parent or an earlier one) with the cards spread over it.
+        nextId = (Category.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        tree = []
+        for id in range(nextId, nextId + categories):
+            categoryParent = self.random.choice(tree) if tree and self.random.random() < 0.8 else parent
+            tree.append(Category(id=id, name=f'Category {id}', parentCategory=categoryParent,
+                                 ordered=self.random.randint(1, 10), path=f'{categoryParent.path}{id}/'))
+        Category.objects.bulk_create(tree)
+
+        today = date.today()
+        Card.objects.bulk_create([
+            Card(front=f'Front {i}', back=f'Back {i}', category=self.random.choice(tree), cardType_id='Fact',
+                 ordered=self.random.randint(1, 10), lastPredictedInterval=0, reviewInterval=0, repetition=0, grade=0,
+                 predictedInterval=1, nextReviewOn=today + timedelta(days=self.random.randint(-30, 30)),
+                 lastReviewOn=today - timedelta(days=self.random.randint(0, 30)))
+            for i in range(cards)], batch_size=500)
+        return tree[0] if tree else parent
+
+    def _report(self, baseline, threshold, minDifference):
+        self.regressions = []
+        if baseline is None:
+            return
+
+        self.stdout.write(f'\n{"compared with baseline":<45} {"p50":>10} {"baseline":>10} {"ratio":>10} {"queries":>8}')
+        for name, result in self.results.items():
+            previous = baseline.get('results', {}).get(name)
+            if previous is None:
+                continue
+            ratio = result['p50'] / previous['p50'] if previous['p50'] else float('inf')
+            slower = ratio > threshold and result['p50'] - previous['p50'] > minDifference
+            regressed = slower or result['queries'] > previous['queries']
+            if regressed:
+                self.regressions.append(name)
+            line = (f'{name:<45} {result["p50"]:>10.3f} {previous["p50"]:>10.3f} {ratio:>10.2f} '
+                    f'{previous["queries"]:>3} -> {result["queries"]:<3}')
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
+
+
+class _DeferredTraining:
+    # Stands in for the training worker so review latency excludes retraining, which is measured on its own.
+
+    def __init__(self):
+        self._cases = []
+
+    def enqueue(self, cases):
+        self._cases.extend(cases)
+
+    def drain(self):
+        cases = self._cases
+        self._cases = []
+        return cases
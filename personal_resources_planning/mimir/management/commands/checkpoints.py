@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from mimir.models import NeuralNetworkCheckpoint
+from mimir.model_sync import modelGeneration
+from mimir.neural_network import pruneCheckpoints
+
+
+class Command(BaseCommand):
+    help = 'List neural network checkpoints, roll the active one back to an earlier version or delete old ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['list', 'rollback', 'prune'])
+        parser.add_argument('version', nargs='?', type=int,
+                            help='Checkpoint to activate on rollback (defaults to the one before the active checkpoint).')
+        parser.add_argument('--limit', type=int, default=20, help='Number of most recent checkpoints to list.')
+        parser.add_argument('--keep', type=int, default=settings.MIMIR_CHECKPOINT_RETENTION or 100,
+                            help='Number of most recent checkpoints kept on prune (the active one is always kept).')
+
+    def handle(self, *args, **options):
+        if options['action'] == 'list':
+            self._list(options['limit'])
+        elif options['action'] == 'prune':
+            self._prune(options['keep'])
+        else:
+            self._rollback(options['version'])
+
+    def _list(self, limit):
+        checkpoints = NeuralNetworkCheckpoint.objects.defer('weights').order_by('-id')[:limit]
+        self.stdout.write(f'{"version":>8}  {"created on":<26}  {"rmse":>10}  {"epochs":>7}')
+        for checkpoint in checkpoints:
+            rmse = f'{checkpoint.rmse:.6f}' if checkpoint.rmse is not None else '-'
+            self.stdout.write(f'{checkpoint.id:>8}  {checkpoint.createdOn.isoformat():<26}  {rmse:>10}  {checkpoint.epochs:>7}'
+                              + ('  (active)' if checkpoint.active else ''))
+
+    def _prune(self, keep):
+        if keep < 1:
+            raise CommandError('--keep must be at least 1.')
+        deleted = pruneCheckpoints(keep)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} checkpoints.'))
+
+    @transaction.atomic
+    def _rollback(self, version):
+        active = NeuralNetworkCheckpoint.objects.select_for_update().filter(active=True).first()
+
+        if version is None:
+            if active is None:
+                raise CommandError('There is no active checkpoint to roll back from.')
+            target = NeuralNetworkCheckpoint.objects.filter(id__lt=active.id).order_by('-id').first()
+            if target is None:
+                raise CommandError(f'Checkpoint {active.id} is the oldest one.')
+        else:
+            try:
+                target = NeuralNetworkCheckpoint.objects.get(id=version)
+            except NeuralNetworkCheckpoint.DoesNotExist:
+                raise CommandError(f'Checkpoint {version} does not exist.')
+
+        NeuralNetworkCheckpoint.objects.filter(active=True).update(active=False)
+        NeuralNetworkCheckpoint.objects.filter(id=target.id).update(active=True)
+        transaction.on_commit(lambda: modelGeneration.publish(target.id))
+        self.stdout.write(self.style.SUCCESS(f'Checkpoint {target.id} is now active.'))
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from mimir.neural_network import feedbackTarget
+from mimir.models import ReviewEvent, TrainingCase
+
+
+class Command(BaseCommand):
+    help = 'Roll review events older than the retention period into aggregated training cases and delete them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=settings.MIMIR_REVIEW_LOG_RETENTION_DAYS,
+                            help='Review events younger than this are kept as they are.')
+        parser.add_argument('--keep-events', type=int, default=settings.MIMIR_REPLAY_CAPACITY,
+                            help='Number of most recent review events that are never compacted, whatever their age.')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Number of events compacted at once.')
+
+    def handle(self, *args, **options):
+        cutoff = datetime.now() - timedelta(days=options['retention_days'])
+        boundary = list(ReviewEvent.objects.order_by('-id').values_list('id', flat=True)[options['keep_events']:options['keep_events'] + 1])
+        if not boundary:
+            self.stdout.write(self.style.SUCCESS('Nothing to compact.'))
+            return
+
+        events = ReviewEvent.objects.filter(id__lte=boundary[0], reviewedOn__lt=cutoff)
+        lastId = 0
+        compacted = 0
+        created = 0
+        updated = 0
+        while True:
+            chunk = list(events.filter(id__gt=lastId).order_by('id').values_list(
+                'id', 'reviewedOn', 'lastPredictedInterval', 'reviewInterval', 'repetition', 'grade', 'predictedInterval',
+                'actualInterval', 'actualGrade')[:options['chunk_size']])
+            if not chunk:
+                break
+
+            chunkCreated, chunkUpdated = self._compact(events, chunk)
+            lastId = chunk[-1][0]
+            compacted += len(chunk)
+            created += chunkCreated
+            updated += chunkUpdated
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Compacted {compacted} review events into {created} new and {updated} updated training cases.'))
+
+    @transaction.atomic
+    def _compact(self, events, chunk):
+        # The training case of every event is averaged into the aggregate of its inputs, then the events are deleted.
+        aggregates = {}
+        for _, reviewedOn, *feedback in chunk:
+            key = tuple(feedback[:4])
+            total, count, updatedOn = aggregates.get(key, (0.0, 0, reviewedOn))
+            aggregates[key] = (total + feedbackTarget(*feedback[4:]), count + 1, max(updatedOn, reviewedOn))
+
+        # Narrowed down per input, then matched exactly.
+        candidates = TrainingCase.objects.filter(lastPredictedInterval__in={key[0] for key in aggregates},
+                                                 reviewInterval__in={key[1] for key in aggregates},
+                                                 repetition__in={key[2] for key in aggregates},
+                                                 grade__in={key[3] for key in aggregates})
+        existing = {}
+        for trainingCase in candidates:
+            key = (trainingCase.lastPredictedInterval, trainingCase.reviewInterval, trainingCase.repetition, trainingCase.grade)
+            if key in aggregates:
+                existing[key] = trainingCase
+
+        newCases = []
+        for key, (total, count, updatedOn) in aggregates.items():
+            trainingCase = existing.get(key)
+            if trainingCase is None:
+                newCases.append(TrainingCase(lastPredictedInterval=key[0], reviewInterval=key[1], repetition=key[2],
+                                             grade=key[3], predictedInterval=total / count, count=count, updatedOn=updatedOn))
+            else:
+                trainingCase.predictedInterval = (trainingCase.predictedInterval * trainingCase.count + total) / (trainingCase.count + count)
+                trainingCase.count += count
+                trainingCase.updatedOn = max(trainingCase.updatedOn, updatedOn)
+        TrainingCase.objects.bulk_create(newCases, batch_size=500)
+        TrainingCase.objects.bulk_update(existing.values(), ['predictedInterval', 'count', 'updatedOn'], batch_size=500)
+
+        events.filter(id__gte=chunk[0][0], id__lte=chunk[-1][0]).delete()
+        return len(newCases), len(existing)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from mimir.card_transfer import importCards, readRows
+from mimir.model_provider import modelProvider
+from mimir.tree_cache import bumpTreeGeneration
+
+
+class Command(BaseCommand):
+    help = 'Import cards from an NDJSON (e.g. a cards/export dump) or CSV file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['ndjson', 'csv'],
+                            help='File format (defaults to csv for .csv files and ndjson otherwise).')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Number of rows validated and inserted at once.')
+
+    def handle(self, *args, **options):
+        format = options['format'] or ('csv' if options['path'].lower().endswith('.csv') else 'ndjson')
+        try:
+            with open(options['path'], newline='', encoding='utf-8') as file:
+                created, errors = importCards(readRows(file, format), modelProvider.neuralNetwork(), options['chunk_size'])
+        except OSError as error:
+            raise CommandError(error)
+
+        for error in errors:
+            self.stderr.write(f'Line {error["line"]}: {error["errors"]}')
+        if created:
+            bumpTreeGeneration()
+        self.stdout.write(self.style.SUCCESS(f'Imported {created} cards, skipped {len(errors)} rows.'))
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand
+from mimir.models import Card
+from mimir.model_provider import modelProvider
+from mimir.tree_cache import bumpTreeGeneration
+
+
+class Command(BaseCommand):
+    help = 'Recompute predictedInterval and nextReviewOn of every card with the active network weights.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Number of cards predicted and updated at once.')
+
+    def handle(self, *args, **options):
+        nn = modelProvider.neuralNetwork()
+        chunkSize = options['chunk_size']
+        lastId = 0
+        total = 0
+        changed = 0
+
+        while True:
+            cards = list(Card.objects.filter(id__gt=lastId).order_by('id').only(
+                'id', 'lastPredictedInterval', 'reviewInterval', 'repetition', 'grade',
+                'predictedInterval', 'nextReviewOn', 'lastReviewOn', 'createdOn', 'updatedOn')[:chunkSize])
+            if not cards:
+                break
+
+            # Unreviewed cards are scheduled like createCard does, with the default grade of 0.
+            intervals = nn.predictNextIntervals(
+                [card.lastPredictedInterval for card in cards],
+                [card.reviewInterval for card in cards],
+                [card.repetition for card in cards],
+                [card.grade if card.repetition > 0 else 0 for card in cards])
+
+            now = datetime.now()
+            rescheduled = []
+            for card, interval in zip(cards, intervals.tolist()):
+                nextReviewOn = card.lastReviewOn + timedelta(days=interval)
+                if card.predictedInterval != interval or card.nextReviewOn != nextReviewOn:
+                    card.predictedInterval = interval
+                    card.nextReviewOn = nextReviewOn
+                    card.updatedOn = now
+                    rescheduled.append(card)
+            Card.objects.bulk_update(rescheduled, ['predictedInterval', 'nextReviewOn', 'updatedOn'])
+
+            total += len(cards)
+            changed += len(rescheduled)
+            lastId = cards[-1].id
+
+        if changed:
+            bumpTreeGeneration()
+        self.stdout.write(self.style.SUCCESS(f'Rescheduled {changed} of {total} cards.'))
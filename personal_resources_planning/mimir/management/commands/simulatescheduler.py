@@ -0,0 +1,123 @@
+import json
+import os
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from mimir.model_provider import modelProvider
+from mimir.models import ReviewEvent
+from mimir.simulation import CONFIG_KEYS, initialWeights, pretrainingCases, runJobs, runSimulation
+
+COLUMNS = ('name', 'pretrainingRMSE', 'reviews', 'rmse', 'intervalMAE', 'workloadMean', 'workloadP95', 'workloadMax',
+           'retention', 'cpuSeconds', 'wallSeconds')
+
+
+class Command(BaseCommand):
+    help = ('Evaluate scheduler configurations offline by replaying the review log (or a synthetic population of '
+            'cards) through the network, running the configurations in parallel worker processes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=['log', 'synthetic'], default='log',
+                            help='Replay the recorded review events or simulate synthetic learners.')
+        parser.add_argument('--cards', type=int, default=2000, help='Cards of the synthetic population.')
+        parser.add_argument('--days', type=int, default=365, help='Days the synthetic population is simulated for.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--train-every', type=int, default=1,
+                            help='Retrain the network on the feedback gathered over this many days.')
+        parser.add_argument('--config', action='append', default=[],
+                            help='JSON object of NeuralNetwork arguments overriding the current settings, with an '
+                                 'optional "name" (repeatable).')
+        parser.add_argument('--configs', help='JSON file holding a list of such objects.')
+        parser.add_argument('--initial-weights', choices=['active', 'random'], default='active',
+                            help='Start every configuration from the active network weights (all configurations need '
+                                 'its hidden layer size) or from random ones (seeded, the same for equal sizes).')
+        parser.add_argument('--pretraining-epochs', type=int, default=200,
+                            help='With random initial weights, first fit every network to the predictions of the '
+                                 'active one for this many epochs, so all configurations start scheduling alike.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Worker processes; 1 runs the simulations in this process.')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+
+    def handle(self, *args, **options):
+        configs = self._configs(options)
+        if options['source'] == 'log':
+            arguments = (self._reviewHistory(), options['train_every'])
+        else:
+            arguments = (options['cards'], options['days'], options['seed'], options['train_every'])
+
+        activeNetwork = modelProvider.neuralNetwork()
+        pretraining = None
+        if options['initial_weights'] == 'active':
+            try:
+                weights = initialWeights(configs, activeNetwork.packedWeights())
+            except ValueError as error:
+                raise CommandError(f'{error}; use --initial-weights random.')
+        else:
+            weights = initialWeights(configs, seed=options['seed'])
+            if options['pretraining_epochs'] > 0:
+                pretraining = (pretrainingCases(activeNetwork), options['pretraining_epochs'], options['seed'])
+            else:
+                self.stderr.write('Warning: the configurations start from random weights without pretraining, so '
+                                  'their results also differ by how they schedule at the start.')
+        jobs = [(name, config, configWeights, pretraining, options['source'], arguments)
+                for (name, config), configWeights in zip(configs, weights)]
+
+        results = runJobs(runSimulation, jobs, options['workers'])
+        self._report(results)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump({'options': {key: options[key] for key in ('source', 'cards', 'days', 'seed', 'train_every',
+                                                                     'initial_weights', 'pretraining_epochs')},
+                           'results': results}, file, indent=2)
+
+    def _configs(self, options):
+        overrides = [self._parseConfig(config) for config in options['config']]
+        if options['configs']:
+            try:
+                with open(options['configs']) as file:
+                    overrides.extend(json.load(file))
+            except (OSError, ValueError) as error:
+                raise CommandError(f'Cannot read configs: {error}')
+        overrides = overrides or [{'name': 'current'}]
+
+        base = {'trainingMode': settings.MIMIR_TRAINING_MODE, 'batchSize': settings.MIMIR_TRAINING_BATCH_SIZE,
+                'replayCapacity': settings.MIMIR_REPLAY_CAPACITY}
+        configs = []
+        for i, override in enumerate(overrides):
+            if not isinstance(override, dict):
+                raise CommandError(f'Config {i + 1} is not a JSON object')
+            override = dict(override)
+            name = str(override.pop('name', f'config {i + 1}'))
+            unknown = set(override) - set(CONFIG_KEYS)
+            if unknown:
+                raise CommandError(f'Unknown NeuralNetwork arguments in {name}: {", ".join(sorted(unknown))}')
+            configs.append((name, {**base, **override}))
+        return configs
+
+    def _parseConfig(self, config):
+        try:
+            return json.loads(config)
+        except ValueError as error:
+            raise CommandError(f'Invalid --config {config!r}: {error}')
+
+    def _reviewHistory(self):
+        events = list(ReviewEvent.objects.order_by('reviewedOn', 'id').values_list(
+            'reviewedOn', 'lastPredictedInterval', 'reviewInterval', 'repetition', 'grade', 'predictedInterval',
+            'actualInterval', 'actualGrade'))
+        if not events:
+            raise CommandError('The review log is empty; use --source synthetic.')
+
+        firstDay = events[0][0].date()
+        return np.array([((reviewedOn.date() - firstDay).days, *feedback) for reviewedOn, *feedback in events], dtype=int)
+
+    def _report(self, results):
+        self.stdout.write(' '.join(f'{column:>15}' if i else f'{column:<20}' for i, column in enumerate(COLUMNS)))
+        for result in results:
+            self.stdout.write(' '.join(self._cell(result.get(column)) if i else f'{result["name"]:<20}'
+                                       for i, column in enumerate(COLUMNS)))
+
+    def _cell(self, value):
+        if value is None:
+            return f'{"-":>15}'
+        if isinstance(value, float):
+            return f'{value:>15.4f}'
+        return f'{value:>15}'
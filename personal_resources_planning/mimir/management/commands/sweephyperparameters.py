@@ -0,0 +1,157 @@
+import itertools
+import json
+import os
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from mimir.model_provider import modelProvider
+from mimir.models import ReviewEvent, TrainingCase
+from mimir.neural_network import feedbackTarget, normalizedInputs
+from mimir.simulation import TRAINING_KEYS, initialWeights, runJobs, trainOnCases
+
+DEFAULT_GRID = {'epochFactor': [2, 4, 8], 'targetRMSE': [0.0125, 0.025], 'learningRates': [[0.9, 0.1], [0.5, 0.1]],
+                'hiddenUnits': [10, 20, 40]}
+COLUMNS = ('rank', 'name', 'converged', 'epochs', 'trainingRMSE', 'validationRMSE', 'cpuSeconds', 'wallSeconds')
+
+
+class Command(BaseCommand):
+    help = ('Train independent networks on a case matrix (exported from the review log) over a grid of training '
+            'hyperparameters in parallel worker processes and rank them by convergence time or validation error.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cases', help='Case matrix (.npy) written by --export-cases; defaults to the review log.')
+        parser.add_argument('--export-cases', help='Write the case matrix of the review log to this .npy file and exit.')
+        parser.add_argument('--grid', help='JSON object mapping NeuralNetwork arguments to the list of values to try '
+                                           f'(default: {json.dumps(DEFAULT_GRID)}).')
+        parser.add_argument('--training-cases', type=int, default=settings.MIMIR_REPLAY_CAPACITY,
+                            help='Cases each network trains on, like the replay memory after a review '
+                                 '(0 trains on all cases not held out).')
+        parser.add_argument('--validation-fraction', type=float, default=0.2,
+                            help='Fraction of the cases held out to measure the final error.')
+        parser.add_argument('--initial-weights', choices=['active', 'random'], default='random',
+                            help='Start every network from random weights (seeded, the same for equal sizes) or from '
+                                 'the active network weights, which only fit grids keeping its hidden layer size.')
+        parser.add_argument('--rank-by', choices=['time', 'error'], default='time',
+                            help='Rank converged runs by CPU time followed by the others by validation RMSE, or all runs '
+                                 'by validation RMSE.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Worker processes; 1 trains in this process.')
+        parser.add_argument('--output', help='Write the ranked results to this JSON file.')
+
+    def handle(self, *args, **options):
+        if options['export_cases']:
+            cases = self._reviewLogCases()
+            np.save(options['export_cases'], cases)
+            self.stdout.write(self.style.SUCCESS(f'Exported {len(cases)} cases.'))
+            return
+
+        if not 0 <= options['validation_fraction'] < 1:
+            raise CommandError('--validation-fraction must be at least 0 and less than 1')
+        grid = self._grid(options['grid'])
+        trainingCases, validationCases = self._splitCases(self._cases(options['cases']), options)
+
+        base = {'trainingMode': settings.MIMIR_TRAINING_MODE, 'batchSize': settings.MIMIR_TRAINING_BATCH_SIZE}
+        configs = [(' '.join(f'{key}={json.dumps(value)}' for key, value in zip(grid, values)),
+                    {**base, **dict(zip(grid, values))}) for values in itertools.product(*grid.values())]
+
+        # The already trained active weights would converge in a few epochs whatever the hyperparameters.
+        if options['initial_weights'] == 'active':
+            try:
+                weights = initialWeights(configs, modelProvider.neuralNetwork().packedWeights())
+            except ValueError as error:
+                raise CommandError(f'{error}; use --initial-weights random.')
+        else:
+            weights = initialWeights(configs, seed=options['seed'])
+        jobs = [(name, config, configWeights, trainingCases, validationCases, options['seed'])
+                for (name, config), configWeights in zip(configs, weights)]
+
+        self.stdout.write(f'{len(jobs)} configurations, {len(trainingCases)} training and {len(validationCases)} '
+                          'validation cases')
+        results = self._rank(runJobs(trainOnCases, jobs, options['workers']), options['rank_by'])
+        self._report(results)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump({'options': {key: options[key] for key in ('cases', 'training_cases', 'validation_fraction',
+                                                                     'initial_weights', 'rank_by', 'seed')},
+                           'grid': grid, 'results': results}, file, indent=2)
+
+    def _grid(self, grid):
+        if grid is None:
+            return DEFAULT_GRID
+        try:
+            grid = json.loads(grid)
+        except ValueError as error:
+            raise CommandError(f'Invalid --grid: {error}')
+
+        if not isinstance(grid, dict) or not grid:
+            raise CommandError('--grid must be a non-empty JSON object')
+        unknown = set(grid) - set(TRAINING_KEYS)
+        if unknown:
+            raise CommandError(f'Unknown training arguments: {", ".join(sorted(unknown))}')
+        for key, values in grid.items():
+            if not isinstance(values, list) or not values:
+                raise CommandError(f'The values of {key} must be a non-empty list')
+        return grid
+
+    def _cases(self, path):
+        if path is None:
+            return self._reviewLogCases()
+        try:
+            cases = np.load(path)
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Cannot read cases: {error}')
+        if cases.ndim != 2 or cases.shape[1] != 5:
+            raise CommandError(f'A case matrix has 5 columns, not shape {cases.shape}')
+        return cases.astype(float)
+
+    def _reviewLogCases(self):
+        # The aggregates of compacted events first, then the events, oldest first as in the replay memory.
+        cases = [normalizedInputs(lastPredictedInterval, reviewInterval, repetition, grade) + [predictedInterval]
+                 for lastPredictedInterval, reviewInterval, repetition, grade, predictedInterval in
+                 TrainingCase.objects.order_by('updatedOn', 'id').values_list(
+                     'lastPredictedInterval', 'reviewInterval', 'repetition', 'grade', 'predictedInterval').iterator()]
+        cases.extend(normalizedInputs(*event[:4]) + [feedbackTarget(*event[4:])]
+                     for event in ReviewEvent.objects.order_by('id').values_list(
+                         'lastPredictedInterval', 'reviewInterval', 'repetition', 'grade', 'predictedInterval',
+                         'actualInterval', 'actualGrade').iterator())
+        if not cases:
+            raise CommandError('The review log is empty.')
+        return np.array(cases, dtype=float).reshape(-1, 5)
+
+    def _splitCases(self, cases, options):
+        cases = np.random.default_rng(options['seed']).permutation(cases)
+        validationSize = int(len(cases) * options['validation_fraction'])
+        trainingCases = cases[validationSize:]
+        if options['training_cases']:
+            trainingCases = trainingCases[:options['training_cases']]
+        if len(trainingCases) == 0:
+            raise CommandError('No cases left to train on.')
+        return trainingCases, cases[:validationSize]
+
+    def _rank(self, results, rankBy):
+        if rankBy == 'time':
+            # The time of a run that never converged only reflects its epoch limit, so those come last by error.
+            key = lambda result: (0, result['cpuSeconds']) if result['converged'] else (1, self._error(result))
+        else:
+            key = lambda result: (self._error(result), result['cpuSeconds'])
+        return [{'rank': rank, **result} for rank, result in enumerate(sorted(results, key=key), 1)]
+
+    def _error(self, result):
+        # Runs without validation cases are ranked by their training error instead.
+        rmse = result['trainingRMSE'] if result['validationRMSE'] is None else result['validationRMSE']
+        return float('inf') if rmse is None else rmse
+
+    def _report(self, results):
+        width = max(len(result['name']) for result in results)
+        self.stdout.write(' '.join(f'{column:<{width}}' if column == 'name' else f'{column:>14}' for column in COLUMNS))
+        for result in results:
+            self.stdout.write(' '.join(f'{result["name"]:<{width}}' if column == 'name' else self._cell(result[column])
+                                       for column in COLUMNS))
+
+    def _cell(self, value):
+        if value is None:
+            return f'{"-":>14}'
+        if isinstance(value, float):
+            return f'{value:>14.4f}'
+        return f'{str(value):>14}'
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:26
+
+import datetime
+import numpy as np
+from django.db import migrations, models
+
+
+def checkpointCurrentWeights(apps, schema_editor):
+    NeuralNetworkWeight = apps.get_model('mimir', 'NeuralNetworkWeight')
+    NeuralNetworkCheckpoint = apps.get_model('mimir', 'NeuralNetworkCheckpoint')
+
+    weights = np.array(NeuralNetworkWeight.objects.order_by('id').values_list('weight', flat=True), dtype='<f8')
+    if weights.size > 0:
+        NeuralNetworkCheckpoint.objects.create(weights=weights.tobytes(), active=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mimir', '0006_alter_card_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NeuralNetworkCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('createdOn', models.DateTimeField(db_column='created_on', default=datetime.datetime.now)),
+                ('weights', models.BinaryField(db_column='weights')),
+                ('rmse', models.FloatField(db_column='rmse', null=True)),
+                ('epochs', models.IntegerField(db_column='epochs', default=0)),
+                ('active', models.BooleanField(db_column='active', default=False)),
+            ],
+            options={
+                'db_table': 'neural_network_checkpoint',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='neuralnetworkcheckpoint',
+            constraint=models.UniqueConstraint(condition=models.Q(('active', True)), fields=('active',), name='single active checkpoint'),
+        ),
+        migrations.RunPython(checkpointCurrentWeights, migrations.RunPython.noop),
+    ]
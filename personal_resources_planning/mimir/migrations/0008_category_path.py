@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:31
+
+from django.db import migrations, models
+
+
+def buildCategoryPaths(apps, schema_editor):
+    Category = apps.get_model('mimir', 'Category')
+    parents = dict(Category.objects.values_list('id', 'parentCategory_id'))
+
+    paths = {}
+    for categoryId in parents:
+        chain = []
+        current = categoryId
+        while current not in paths:
+            chain.append(current)
+            if parents[current] in chain:
+                # The root parent refers to itself.
+                prefix = '/'
+                break
+            current = parents[current]
+        else:
+            prefix = paths[current]
+
+        for id in reversed(chain):
+            prefix = paths[id] = f'{prefix}{id}/'
+
+    Category.objects.bulk_update([Category(id=id, path=path) for id, path in paths.items()], ['path'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mimir', '0007_neural_network_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.TextField(db_column='path', db_index=True, default=''),
+        ),
+        migrations.RunPython(buildCategoryPaths, migrations.RunPython.noop),
+    ]
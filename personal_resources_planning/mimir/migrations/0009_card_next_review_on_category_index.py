@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mimir', '0008_category_path'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['nextReviewOn', 'category'], name='card_next_review_on_category'),
+        ),
+    ]
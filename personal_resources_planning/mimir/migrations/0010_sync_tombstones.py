@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:43
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mimir', '0009_card_next_review_on_category_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.TextField(choices=[('card', 'Card'), ('category', 'Category')], db_column='model')),
+                ('objectId', models.BigIntegerField(db_column='object_id')),
+                ('deletedOn', models.DateTimeField(db_column='deleted_on', default=datetime.datetime.now)),
+            ],
+            options={
+                'db_table': 'tombstone',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['updatedOn'], name='card_updated_on'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['updatedOn'], name='category_updated_on'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['deletedOn'], name='tombstone_deleted_on'),
+        ),
+    ]
@@ -0,0 +1,106 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:46
+
+import datetime
+from django.db import migrations, models
+
+
+def _interval(normalized):
+    return round(normalized * normalized * 2048)
+
+
+def aggregateUserCases(apps, schema_editor):
+    # user_case only holds normalized cases, so they become training case aggregates rather than review events.
+    UserCase = apps.get_model('mimir', 'UserCase')
+    TrainingCase = apps.get_model('mimir', 'TrainingCase')
+
+    aggregates = {}
+    for createdOn, lastPredictedInterval, reviewInterval, repetition, grade, predictedInterval in \
+            UserCase.objects.order_by('createdOn').values_list('createdOn', 'lastPredictedInterval', 'reviewInterval',
+                                                               'repetition', 'grade', 'predictedInterval').iterator():
+        key = (_interval(lastPredictedInterval), _interval(reviewInterval), round(repetition * 128), round(grade * 5))
+        total, count, _ = aggregates.get(key, (0.0, 0, None))
+        aggregates[key] = (total + predictedInterval, count + 1, createdOn)
+
+    TrainingCase.objects.bulk_create([
+        TrainingCase(lastPredictedInterval=key[0], reviewInterval=key[1], repetition=key[2], grade=key[3],
+                     predictedInterval=total / count, count=count, updatedOn=updatedOn)
+        for key, (total, count, updatedOn) in aggregates.items()], batch_size=500)
+
+
+def expandTrainingCases(apps, schema_editor):
+    # Review events recorded since migrating are not converted back.
+    UserCase = apps.get_model('mimir', 'UserCase')
+    TrainingCase = apps.get_model('mimir', 'TrainingCase')
+
+    UserCase.objects.bulk_create([
+        UserCase(createdOn=trainingCase.updatedOn + datetime.timedelta(microseconds=i),
+                 lastPredictedInterval=(trainingCase.lastPredictedInterval / 2048) ** 0.5,
+                 reviewInterval=(trainingCase.reviewInterval / 2048) ** 0.5,
+                 repetition=trainingCase.repetition / 128,
+                 grade=trainingCase.grade / 5,
+                 predictedInterval=min(trainingCase.predictedInterval, 1.0))
+        for i, trainingCase in enumerate(TrainingCase.objects.order_by('updatedOn', 'id'))], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mimir', '0010_sync_tombstones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cardId', models.BigIntegerField(db_column='card_id', null=True)),
+                ('reviewedOn', models.DateTimeField(db_column='reviewed_on', default=datetime.datetime.now)),
+                ('lastPredictedInterval', models.PositiveSmallIntegerField(db_column='last_predicted_interval')),
+                ('reviewInterval', models.PositiveSmallIntegerField(db_column='review_interval')),
+                ('repetition', models.PositiveSmallIntegerField(db_column='repetition')),
+                ('grade', models.PositiveSmallIntegerField(db_column='grade')),
+                ('predictedInterval', models.PositiveSmallIntegerField(db_column='predicted_interval')),
+                ('actualInterval', models.PositiveIntegerField(db_column='actual_interval')),
+                ('actualGrade', models.PositiveSmallIntegerField(db_column='actual_grade')),
+            ],
+            options={
+                'db_table': 'review_event',
+            },
+        ),
+        migrations.CreateModel(
+            name='TrainingCase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lastPredictedInterval', models.PositiveSmallIntegerField(db_column='last_predicted_interval')),
+                ('reviewInterval', models.PositiveSmallIntegerField(db_column='review_interval')),
+                ('repetition', models.PositiveSmallIntegerField(db_column='repetition')),
+                ('grade', models.PositiveSmallIntegerField(db_column='grade')),
+                ('predictedInterval', models.FloatField(db_column='predicted_interval')),
+                ('count', models.PositiveIntegerField(db_column='count')),
+                ('updatedOn', models.DateTimeField(db_column='updated_on', default=datetime.datetime.now)),
+            ],
+            options={
+                'db_table': 'training_case',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='trainingcase',
+            index=models.Index(fields=['updatedOn'], name='training_case_updated_on'),
+        ),
+        migrations.AddConstraint(
+            model_name='trainingcase',
+            constraint=models.UniqueConstraint(fields=('lastPredictedInterval', 'reviewInterval', 'repetition', 'grade'), name='training case inputs'),
+        ),
+        migrations.AddConstraint(
+            model_name='trainingcase',
+            constraint=models.CheckConstraint(check=models.Q(('predictedInterval__gte', 0.0)), name='predictedInterval range training case'),
+        ),
+        migrations.AddIndex(
+            model_name='reviewevent',
+            index=models.Index(fields=['reviewedOn'], name='review_event_reviewed_on'),
+        ),
+        migrations.RunPython(aggregateUserCases, expandTrainingCases),
+        migrations.DeleteModel(
+            name='UserCase',
+        ),
+    ]
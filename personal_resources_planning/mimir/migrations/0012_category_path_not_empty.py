@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:30
+
+from django.db import migrations, models
+
+
+def fillEmptyPaths(apps, schema_editor):
+    # Categories created outside CategorySerializer since 0008 were left with an empty path; give them theirs, parents
+    # first, before the constraint forbids it.
+    Category = apps.get_model('mimir', 'Category')
+    while True:
+        orphans = list(Category.objects.filter(path='').exclude(parentCategory__path='').select_related('parentCategory'))
+        if not orphans:
+            break
+        for category in orphans:
+            category.path = f'{category.parentCategory.path}{category.id}/'
+        Category.objects.bulk_update(orphans, ['path'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mimir', '0011_review_event_log'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='category',
+            name='path',
+            field=models.TextField(db_column='path', db_index=True, null=True),
+        ),
+        migrations.RunPython(fillEmptyPaths, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='category',
+            constraint=models.CheckConstraint(check=models.Q(('path', ''), _negated=True), name='path_not_empty'),
+        ),
+    ]
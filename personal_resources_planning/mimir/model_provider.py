@@ -0,0 +1,74 @@
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import connection
+from mimir.neural_network import NeuralNetwork
+from mimir.training import TrainingWorker
+
+logger = logging.getLogger(__name__)
+
+
+class ModelProvider:
+    # Process-wide scheduling network and its training worker. Nothing is loaded on import, so URL loading and
+    # management commands (e.g. migrate on a fresh database) never query the network tables; the network is loaded
+    # on first use or by warmUp().
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._neuralNetwork = None
+        self._trainingWorker = None
+        self.loadSeconds = None
+
+    def neuralNetwork(self):
+        neuralNetwork = self._neuralNetwork or self._load()
+        # Pick up checkpoints activated by other worker processes.
+        neuralNetwork.syncWithPublishedVersion()
+        return neuralNetwork
+
+    def trainingWorker(self):
+        if self._trainingWorker is None:
+            self._load()
+        return self._trainingWorker
+
+    def use(self, neuralNetwork, trainingWorker):
+        # Replaces the loaded network (e.g. by one trained elsewhere); returns the previous pair.
+        with self._lock:
+            previous = self._neuralNetwork, self._trainingWorker
+            self._neuralNetwork, self._trainingWorker = neuralNetwork, trainingWorker
+        return previous
+
+    def warmUp(self, background = True):
+        # Loads the network ahead of the first request; in the background the worker starts serving meanwhile.
+        if not background:
+            self._load()
+            return
+        threading.Thread(target=self._warmUpInThread, name='mimir-warm-up', daemon=True).start()
+
+    def _warmUpInThread(self):
+        try:
+            self._load()
+        except Exception:
+            # The first request loads the network again (and reports the error) if warming up failed.
+            logger.exception('Warming up the scheduling network failed')
+        finally:
+            connection.close()
+
+    def _load(self):
+        with self._lock:
+            if self._neuralNetwork is None:
+                start = time.perf_counter()
+                neuralNetwork = NeuralNetwork(trainingMode=settings.MIMIR_TRAINING_MODE,
+                                              batchSize=settings.MIMIR_TRAINING_BATCH_SIZE,
+                                              replayCapacity=settings.MIMIR_REPLAY_CAPACITY,
+                                              checkpointRetention=settings.MIMIR_CHECKPOINT_RETENTION,
+                                              aggregateSlots=settings.MIMIR_REPLAY_AGGREGATE_SLOTS)
+                self._trainingWorker = TrainingWorker(neuralNetwork, background=settings.MIMIR_BACKGROUND_TRAINING)
+                self._neuralNetwork = neuralNetwork
+                self.loadSeconds = time.perf_counter() - start
+                logger.info('Loaded scheduling network version %s in %.1f ms', neuralNetwork.version,
+                            self.loadSeconds * 1000)
+            return self._neuralNetwork
+
+
+modelProvider = ModelProvider()
@@ -0,0 +1,42 @@
+import os
+from django.conf import settings
+
+
+class ModelGeneration:
+    # Shares the active checkpoint version between worker processes through a small file, so each process
+    # only has to stat() it per request and reloads weights from the database only when it changed.
+
+    def __init__(self, path):
+        self._path = path
+        self._lastStat = None
+
+    def publish(self, version):
+        if self._path is None:
+            return
+        temporaryPath = f'{self._path}.{os.getpid()}.tmp'
+        with open(temporaryPath, 'w') as file:
+            file.write(str(version))
+        os.replace(temporaryPath, self._path)
+
+    def poll(self):
+        # Returns the published version if the file changed since the last poll, otherwise None.
+        if self._path is None:
+            return None
+        try:
+            stat = os.stat(self._path)
+        except FileNotFoundError:
+            return None
+
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if key == self._lastStat:
+            return None
+        self._lastStat = key
+
+        try:
+            with open(self._path) as file:
+                return int(file.read())
+        except (OSError, ValueError):
+            return None
+
+
+modelGeneration = ModelGeneration(settings.MIMIR_MODEL_GENERATION_FILE)
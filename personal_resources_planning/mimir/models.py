@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from datetime import datetime, date
 
 class NeuralNetworkWeight(models.Model):
@@ -7,23 +7,58 @@ class NeuralNetworkWeight(models.Model):
     class Meta:
         db_table = 'neural_network_weight'
 
-class UserCase(models.Model):
-    createdOn = models.DateTimeField(db_column='created_on', primary_key=True, default=datetime.now)
+class NeuralNetworkCheckpoint(models.Model):
+    createdOn = models.DateTimeField(db_column='created_on', default=datetime.now)
+    weights = models.BinaryField(db_column='weights')
+    rmse = models.FloatField(db_column='rmse', null=True)
+    epochs = models.IntegerField(db_column='epochs', default=0)
+    active = models.BooleanField(db_column='active', default=False)
+
+    class Meta:
+        db_table = 'neural_network_checkpoint'
+        constraints = [
+            models.UniqueConstraint(fields=['active'], condition=models.Q(active=True), name='single active checkpoint'),
+        ]
+
+class ReviewEvent(models.Model):
+    # Append-only log of reviews: the card state before the review and its outcome, from which the training case is
+    # derived. Old events are rolled into TrainingCase by the compactreviewlog command.
+    cardId = models.BigIntegerField(db_column='card_id', null=True)
+    reviewedOn = models.DateTimeField(db_column='reviewed_on', default=datetime.now)
+
+    lastPredictedInterval = models.PositiveSmallIntegerField(db_column='last_predicted_interval')
+    reviewInterval = models.PositiveSmallIntegerField(db_column='review_interval')
+    repetition = models.PositiveSmallIntegerField(db_column='repetition')
+    grade = models.PositiveSmallIntegerField(db_column='grade')
+    predictedInterval = models.PositiveSmallIntegerField(db_column='predicted_interval')
+    actualInterval = models.PositiveIntegerField(db_column='actual_interval')
+    actualGrade = models.PositiveSmallIntegerField(db_column='actual_grade')
 
-    lastPredictedInterval = models.FloatField(db_column='last_predicted_interval')
-    reviewInterval = models.FloatField(db_column='review_interval')
-    repetition = models.FloatField(db_column='repetition')
-    grade = models.FloatField(db_column='grade')
+    class Meta:
+        db_table = 'review_event'
+        indexes = [
+            models.Index(fields=['reviewedOn'], name='review_event_reviewed_on'),
+        ]
+
+class TrainingCase(models.Model):
+    # Aggregate of compacted review events sharing the same network inputs: predictedInterval is the mean normalized
+    # target interval of count events.
+    lastPredictedInterval = models.PositiveSmallIntegerField(db_column='last_predicted_interval')
+    reviewInterval = models.PositiveSmallIntegerField(db_column='review_interval')
+    repetition = models.PositiveSmallIntegerField(db_column='repetition')
+    grade = models.PositiveSmallIntegerField(db_column='grade')
     predictedInterval = models.FloatField(db_column='predicted_interval')
+    count = models.PositiveIntegerField(db_column='count')
+    updatedOn = models.DateTimeField(db_column='updated_on', default=datetime.now)
 
     class Meta:
-        db_table = 'user_case'
+        db_table = 'training_case'
+        indexes = [
+            models.Index(fields=['updatedOn'], name='training_case_updated_on'),
+        ]
         constraints = [
-            models.CheckConstraint(check = models.Q(lastPredictedInterval__gte = 0.0) & models.Q(lastPredictedInterval__lte = 1.0), name='lastPredictedInterval range'),
-            models.CheckConstraint(check = models.Q(reviewInterval__gte = 0.0) & models.Q(reviewInterval__lte = 1.0), name='reviewInterval range'),
-            models.CheckConstraint(check = models.Q(repetition__gte = 0.0) & models.Q(repetition__lte = 1.0), name='repetition range'),
-            models.CheckConstraint(check = models.Q(grade__gte = 0.0) & models.Q(grade__lte = 1.0), name='grade range'),
-            models.CheckConstraint(check = models.Q(predictedInterval__gte = 0.0) & models.Q(predictedInterval__lte = 1.0), name='predictedInterval range'),
+            models.UniqueConstraint(fields=['lastPredictedInterval', 'reviewInterval', 'repetition', 'grade'], name='training case inputs'),
+            models.CheckConstraint(check = models.Q(predictedInterval__gte = 0.0), name='predictedInterval range training case'),
         ]
 
 class CardType(models.Model):
@@ -32,18 +67,58 @@ class CardType(models.Model):
     class Meta:
         db_table = 'card_type'
 
+class CategoryManager(models.Manager):
+    # path holds the ids from the root parent down to the category, e.g. '/0/1/6/'. A subtree is the range of paths
+    # from the category's own path up to (excluding) the same path with the trailing '/' replaced by '0', the next
+    # character, which the path index serves as a single range scan.
+
+    def pathRange(self, category):
+        # An empty path would make the range cover every category.
+        if not category.path:
+            raise ValueError(f'Category {category.id} has no path')
+        return category.path, category.path[:-1] + '0'
+
+    def subtreeOf(self, category):
+        start, end = self.pathRange(category)
+        return self.filter(path__gte=start, path__lt=end)
+
+    def descendantsOf(self, category):
+        start, end = self.pathRange(category)
+        return self.filter(path__gt=start, path__lt=end)
+
+    def ancestorsOf(self, category):
+        return self.filter(id__in=[int(id) for id in category.path.strip('/').split('/')[:-1]])
+
 class Category(models.Model):
     name = models.TextField(db_column='name')
     createdOn = models.DateTimeField(db_column='created_on', default=datetime.now)
     updatedOn = models.DateTimeField(db_column='updated_on', default=datetime.now)
     parentCategory = models.ForeignKey(db_column='parent_category', to='self', on_delete=models.PROTECT, default=1, related_name='children')
     ordered = models.IntegerField(db_column='ordered')
+    # Only NULL between the INSERT of a new category and the UPDATE giving it its path, within save().
+    path = models.TextField(db_column='path', null=True, db_index=True)
+
+    objects = CategoryManager()
+
+    def save(self, *args, **kwargs):
+        if self.path:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            if self.id is None:
+                super().save(*args, **kwargs)
+                kwargs = {'update_fields': ['path']}
+            self.path = f'{self.parentCategory.path}{self.id}/'
+            super().save(*args, **kwargs)
 
     class Meta:
         db_table = 'category'
+        indexes = [
+            models.Index(fields=['updatedOn'], name='category_updated_on'),
+        ]
         constraints = [
             models.CheckConstraint(check=models.Q(updatedOn__gte=models.F('createdOn')), name='updatedOn_gte_createdOn'),
             models.CheckConstraint(check=models.Q(ordered__gt=0), name='ordered_gt_0'),
+            models.CheckConstraint(check=~models.Q(path=''), name='path_not_empty'),
         ]
 
 class Card(models.Model):
@@ -66,6 +141,10 @@ class Card(models.Model):
 
     class Meta:
         db_table = 'card'
+        indexes = [
+            models.Index(fields=['nextReviewOn', 'category'], name='card_next_review_on_category'),
+            models.Index(fields=['updatedOn'], name='card_updated_on'),
+        ]
         constraints = [
             models.CheckConstraint(check = models.Q(lastPredictedInterval__gte = 0) & models.Q(lastPredictedInterval__lte = 2048), name='lastPredictedInterval range card'),
             models.CheckConstraint(check = models.Q(reviewInterval__gte = 0) & models.Q(reviewInterval__lte = 2048), name='review range card'),
@@ -74,4 +153,19 @@ class Card(models.Model):
             models.CheckConstraint(check = models.Q(predictedInterval__gte = 0) & models.Q(predictedInterval__lte = 2048), name='predictedInterval range cared'),
             models.CheckConstraint(check = models.Q(updatedOn__gte=models.F('createdOn')), name='updatedOn_gte_createdOn card'),
             models.CheckConstraint(check = models.Q(ordered__gt=0), name='ordered_gt_0 card'),
+        ]
+
+class Tombstone(models.Model):
+    # Ids of deleted cards and categories, so /sync can tell clients what to remove.
+    CARD = 'card'
+    CATEGORY = 'category'
+
+    model = models.TextField(db_column='model', choices=[(CARD, 'Card'), (CATEGORY, 'Category')])
+    objectId = models.BigIntegerField(db_column='object_id')
+    deletedOn = models.DateTimeField(db_column='deleted_on', default=datetime.now)
+
+    class Meta:
+        db_table = 'tombstone'
+        indexes = [
+            models.Index(fields=['deletedOn'], name='tombstone_deleted_on'),
         ]
\ No newline at end of file
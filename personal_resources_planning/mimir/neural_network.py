@@ -1,109 +1,311 @@
+import copy
 import math
+import threading
 import numpy as np
 from numpy.random import shuffle
 from django.db import transaction
-from mimir.models import NeuralNetworkWeight, UserCase
+from mimir.models import NeuralNetworkCheckpoint, NeuralNetworkWeight, ReviewEvent, TrainingCase
+from mimir.model_sync import modelGeneration
+from mimir.replay_memory import ReplayMemory
+
+MAX_REPETITION = 128.0
+MAX_INTERVAL = 2048.0
+MAX_GRADE = 5.0
+GRADE_FACTORS = (0.4, 0.55, 0.7, 0.85, 1.0, 1.2)
+
+
+def normalizedInputs(lastPredictedInterval, reviewInterval, repetition, grade):
+    return [
+        math.sqrt(lastPredictedInterval / MAX_INTERVAL),
+        math.sqrt(reviewInterval / MAX_INTERVAL),
+        repetition / MAX_REPETITION,
+        grade / MAX_GRADE
+    ]
+
+
+def feedbackTarget(predictedInterval, actualInterval, actualGrade, gradeFactors = GRADE_FACTORS):
+    # The normalized better interval of a review: what the network is trained to have predicted. Needs no network,
+    # so the review log can be compacted without loading one.
+    betterInterval = actualInterval
+    factor = 0.0
+    match actualGrade:
+        case 0:
+            if actualInterval > predictedInterval:
+                betterInterval = (actualInterval + predictedInterval) / 2
+            factor = gradeFactors[0]
+        case 1:
+            if actualInterval > predictedInterval:
+                betterInterval = (actualInterval + predictedInterval) / 2
+            factor = gradeFactors[1]
+        case 2:
+            if actualInterval > predictedInterval:
+                betterInterval = (actualInterval + predictedInterval) / 2
+            factor = gradeFactors[2]
+        case 3:
+            if actualInterval > predictedInterval:
+                betterInterval = (actualInterval + predictedInterval) / 2
+            factor = gradeFactors[3]
+        case 4:
+            factor = gradeFactors[4]
+        case 5:
+            if actualInterval < predictedInterval:
+                betterInterval = (actualInterval + predictedInterval) / 2
+            factor = gradeFactors[5]
+        case _:
+            factor = 0.0
+
+    betterInterval *= factor
+
+    return math.sqrt(betterInterval / MAX_INTERVAL)
+
+
+def pruneCheckpoints(keep):
+    # Deletes all but the keep most recent checkpoints; the active one is never deleted, even after a rollback.
+    if keep < 1:
+        raise ValueError('At least one checkpoint has to be kept')
+    oldestKept = list(NeuralNetworkCheckpoint.objects.order_by('-id').values_list('id', flat = True)[keep - 1:keep])
+    if not oldestKept:
+        return 0
+    return NeuralNetworkCheckpoint.objects.filter(id__lt = oldestKept[0], active = False).delete()[0]
 
 
 class NeuralNetwork:
 
-    def __init__(self):
-        self._maxRepetition = 128.0
-        self._maxInterval = 2048.0
-        self._maxGrade = 5.0
+    TRAINING_MODES = ('online', 'batch')
+
+    def __init__(self,
+                 trainingMode = 'online',
+                 batchSize = None,
+                 replayCapacity = 101,
+                 hiddenUnits = 20,
+                 learningRates = (0.9, 0.1),
+                 learningRateThreshold = 0.02,
+                 gradeFactors = GRADE_FACTORS,
+                 epochFactor = 8,
+                 targetRMSE = 0.0125,
+                 weights = None,
+                 persistent = True,
+                 checkpointRetention = None,
+                 aggregateSlots = 0):
+        if trainingMode not in NeuralNetwork.TRAINING_MODES:
+            raise ValueError(f'Unknown training mode: {trainingMode}')
+        if len(gradeFactors) != 6:
+            raise ValueError('One grade factor is needed for each grade from 0 to 5')
+        if not persistent and weights is None:
+            raise ValueError('A network that is not persistent needs initial weights')
+
+        self._maxRepetition = MAX_REPETITION
+        self._maxInterval = MAX_INTERVAL
+        self._maxGrade = MAX_GRADE
 
         self._normalizeRepetition = lambda repetition: repetition / self._maxRepetition
         self._normalizeInterval = lambda day: math.sqrt(day / self._maxInterval)
         self._normalizeGrade = lambda grade: grade / self._maxGrade
         self._deNormalizeInterval = lambda day: round(math.pow(day, 2) * self._maxInterval)
 
+        # Feedback cases kept for retraining; _userCases is the case matrix of a single training run. Up to
+        # aggregateSlots of the replay memory hold the aggregates of compacted review events, the rest recent feedback.
+        self.replayCapacity = replayCapacity
+        self.aggregateSlots = min(aggregateSlots, replayCapacity - 1)
+        self._replayMemory: ReplayMemory
         self._userCases: np.ndarray
 
-        self._network = [NeuralNetwork.Layer(4), NeuralNetwork.Layer(20), NeuralNetwork.Layer(1)]
-        self._sigmoid = lambda x: 1.0 / (1.0 + math.pow(math.e, -x))
+        self._network = [NeuralNetwork.Layer(4), NeuralNetwork.Layer(hiddenUnits, 4), NeuralNetwork.Layer(1, hiddenUnits)]
+        self._sigmoid = lambda x: 1.0 / (1.0 + np.exp(-x))
         self._sigmoidDerivative = lambda y: y * (1.0 - y)
-        self._rootedMeanSquaredError = lambda errors: math.sqrt(sum([math.pow(e, 2) for e in errors]) / len(errors))
-
-        self.latestLearningRate = 0.1
+        self._rootedMeanSquaredError = lambda errors: math.sqrt(np.mean(np.square(errors)))
+
+        # 'online' trains case by case (SGD), 'batch' takes one averaged gradient step per batchSize cases
+        # (the whole case matrix per step when batchSize is None).
+        self.trainingMode = trainingMode
+        self.batchSize = batchSize
+
+        # Training runs take learningRates[0] while the RMSE is at least learningRateThreshold and learningRates[1]
+        # below it, for at most epochFactor * cases.size epochs or until targetRMSE. gradeFactors scale the better
+        # interval of a review by its grade.
+        self.learningRates = learningRates
+        self.learningRateThreshold = learningRateThreshold
+        self.gradeFactors = gradeFactors
+        self.epochFactor = epochFactor
+        self.targetRMSE = targetRMSE
+
+        # A network that is not persistent (e.g. in simulations) never reads or writes the database: it starts from
+        # the given weights with an empty replay memory and keeps its checkpoints to itself.
+        self.persistent = persistent
+        # Number of most recent checkpoints kept when a new one is saved (None keeps them all).
+        self.checkpointRetention = checkpointRetention
+
+        # Predictions only read _serving, an immutable (weights, predictions) snapshot that is replaced as a whole
+        # after training or reloading, so memoized predictions never outlive the weights they came from.
+        # Training, reloading and _replayMemory are serialized by _trainingLock.
+        self._serving: tuple
+        self.predictionCacheSize = 4096
+        self._trainingLock = threading.Lock()
+
+        self.version = None
+        self.latestLearningRate = learningRates[1]
         self.latestRMSE = 0.0
         self.totalSessionEpochs = 0
 
-        self._restoreWeights()
-        self._restoreUserCases()
+        if weights is not None:
+            self._loadWeights(np.asarray(weights, dtype = float))
+        else:
+            self._restoreWeights()
+        if persistent:
+            self._restoreReplayMemory()
+        else:
+            self._replayMemory = ReplayMemory(replayCapacity)
+        self._snapshotWeights()
 
     class Layer:
-        def __init__(self, units):
+        def __init__(self, units, inputs = 0):
             self.units = units
-            self.weights = np.zeros((units, 20))
+            self.weights = np.zeros((units, inputs))
             self.outputs = np.zeros(units)
             self.errors = np.zeros(units)
 
     def _restoreWeights(self):
-        weights = [i.weight for i in NeuralNetworkWeight.objects.all()]
+        checkpoint = NeuralNetworkCheckpoint.objects.filter(active = True).first()
+        if checkpoint is not None:
+            weights = np.frombuffer(bytes(checkpoint.weights), dtype = '<f8')
+            self.version = checkpoint.id
+        else:
+            # No checkpoint yet: start from the initial weights loaded by the neural_network_weight fixture.
+            weights = np.array(NeuralNetworkWeight.objects.order_by('id').values_list('weight', flat=True))
+        self._loadWeights(weights)
+
+    def _loadWeights(self, weights):
+        if weights.size != sum(layer.weights.size for layer in self._network[1:]):
+            raise ValueError(f'{weights.size} weights do not fit a network with {self._network[1].units} hidden units')
+
         counter = 0
-        for l in range(1, len(self._network)):
-            for w in range(0, self._network[l].units):
-                self._network[l].weights[w][0:self._network[l - 1].units] = weights[counter:counter + self._network[l - 1].units]
-                counter += self._network[l - 1].units
-
-    def _restoreUserCases(self):
-        userCases = UserCase.objects.order_by('-createdOn')[:101]
-        cases = []
-        for case in userCases:
-            duplicateCase = [c for c in cases
-                       if c[0] == case.lastPredictedInterval and
-                       c[1] == case.reviewInterval and
-                       c[2] == case.repetition and
-                       c[3] == case.grade]
-            if duplicateCase == []:
-                cases.append([case.lastPredictedInterval, case.reviewInterval, case.repetition, case.grade, case.predictedInterval])
-            else:
-                duplicateCase[0][4] = (duplicateCase[0][4] + case.predictedInterval) / 2
-        self._userCases = np.array(cases)
+        for layer in self._network[1:]:
+            layer.weights[:] = weights[counter:counter + layer.weights.size].reshape(layer.weights.shape)
+            counter += layer.weights.size
+
+    def packedWeights(self):
+        return np.concatenate([layer.weights.ravel() for layer in self._network[1:]]).astype('<f8')
+
+    def _restoreReplayMemory(self):
+        # The aggregates of compacted events backed by the most reviews are pinned in the replay memory, so the
+        # training window keeps covering the compacted history; the latest review events fill the rest.
+        trainingCases = TrainingCase.objects.order_by('-count', '-updatedOn', '-id').values_list(
+            'lastPredictedInterval', 'reviewInterval', 'repetition', 'grade', 'predictedInterval'
+        )[:self.aggregateSlots] if self.aggregateSlots else []
+        memory = ReplayMemory(self.replayCapacity, [
+            self._normalizedInputs(lastPredictedInterval, reviewInterval, repetition, grade) + [predictedInterval]
+            for lastPredictedInterval, reviewInterval, repetition, grade, predictedInterval in trainingCases])
+
+        # Replay oldest first so duplicates are averaged in the same order as live feedback.
+        events = list(ReviewEvent.objects.order_by('-id').values_list(
+            'lastPredictedInterval', 'reviewInterval', 'repetition', 'grade', 'predictedInterval', 'actualInterval',
+            'actualGrade')[:self.replayCapacity - memory.pinned])
+        for event in reversed(events):
+            memory.add(self._feedbackCase(*event))
+        self._replayMemory = memory
 
     @transaction.atomic
-    def _saveWeights(self):
-        pk = 1
-        for l in range(1, len(self._network)):
-            for w in range(0, self._network[l].units):
-                for i in range(0, self._network[l - 1].units):
-                    NeuralNetworkWeight.objects.filter(id = pk).update(weight = self._network[l].weights[w][i])
-                    pk += 1
+    def _saveWeights(self, epochs = 0):
+        weights = self.packedWeights()
+        NeuralNetworkCheckpoint.objects.filter(active = True).update(active = False)
+        checkpoint = NeuralNetworkCheckpoint.objects.create(
+            weights = weights.tobytes(),
+            rmse = self.latestRMSE,
+            epochs = epochs,
+            active = True)
+        self.version = checkpoint.id
+        if self.checkpointRetention is not None:
+            pruneCheckpoints(self.checkpointRetention)
+        transaction.on_commit(lambda: modelGeneration.publish(checkpoint.id))
+
+    def _snapshotWeights(self):
+        weights = tuple(layer.weights.copy() for layer in self._network[1:])
+        for w in weights:
+            w.flags.writeable = False
+        # Every new card is scheduled from (0, 0, 0, 0), so that entry is computed up front.
+        predictions = {(0, 0, 0, 0): self._deNormalizeInterval(self._evaluate(weights, (0.0, 0.0, 0.0, 0.0))[0])}
+        self._serving = (weights, predictions)
+
+    def reload(self):
+        with self._trainingLock:
+            self._reload()
+
+    def _reload(self):
+        reloaded = copy.copy(self)
+        reloaded._network = copy.deepcopy(self._network)
+        reloaded._restoreWeights()
+        reloaded._restoreReplayMemory()
+
+        self._network = reloaded._network
+        self._replayMemory = reloaded._replayMemory
+        self.version = reloaded.version
+        self._snapshotWeights()
+
+    def syncWithPublishedVersion(self):
+        # Never wait for a training run here; the published version is picked up by a later request.
+        if not self._trainingLock.acquire(blocking = False):
+            return
+        try:
+            version = modelGeneration.poll()
+            if version is not None and version != self.version:
+                self._reload()
+        finally:
+            self._trainingLock.release()
     
-    def _saveUserCase(self, lastPredictedInterval, reviewInterval, repetition, grade, betterInterval):
-        UserCase.objects.create(
-            lastPredictedInterval = self._normalizeInterval(lastPredictedInterval),
-            reviewInterval = self._normalizeInterval(reviewInterval),
-            repetition = self._normalizeRepetition(repetition),
-            grade = self._normalizeGrade(grade),
-            predictedInterval = self._normalizeInterval(betterInterval))
-
     def _propagation(self, lastPredictedInterval, reviewInterval, repetition, grade):
-        self._network[0].outputs[0] = lastPredictedInterval
-        self._network[0].outputs[1] = reviewInterval
-        self._network[0].outputs[2] = repetition
-        self._network[0].outputs[3] = grade
+        self._network[0].outputs[:] = (lastPredictedInterval, reviewInterval, repetition, grade)
 
         for l in range(0, len(self._network) - 1):
-            for i in range(0, self._network[l + 1].units):
-                sum = 0.0
-
-                for j in range(0, self._network[l].units):
-                    sum += self._network[l + 1].weights[i][j] * self._network[l].outputs[j]
-
-                self._network[l + 1].outputs[i] = self._sigmoid(sum)
+            self._network[l + 1].outputs[:] = self._sigmoid(self._network[l + 1].weights @ self._network[l].outputs)
 
         return self._network[-1].outputs[0]
 
+    def _evaluate(self, weights, inputs):
+        outputs = np.asarray(inputs, dtype = float)
+        for w in weights:
+            outputs = self._sigmoid(w @ outputs)
+        return outputs
+
     def predictNextInterval(self, predictedInterval, reviewInterval, repetition, grade):
-        return self._deNormalizeInterval(
-            self._propagation(
-                self._normalizeInterval(predictedInterval),
-                self._normalizeInterval(reviewInterval),
-                self._normalizeRepetition(repetition),
-                self._normalizeGrade(grade)
+        weights, predictions = self._serving
+        key = (predictedInterval, reviewInterval, repetition, grade)
+        prediction = predictions.get(key)
+        if prediction is None:
+            prediction = self._deNormalizeInterval(
+                self._evaluate(weights, (
+                    self._normalizeInterval(predictedInterval),
+                    self._normalizeInterval(reviewInterval),
+                    self._normalizeRepetition(repetition),
+                    self._normalizeGrade(grade)
+                ))[0]
             )
-        )
+            self._memoize(predictions, key, prediction)
+        return prediction
+
+    def predictNextIntervals(self, predictedIntervals, reviewIntervals, repetitions, grades):
+        weights, predictions = self._serving
+        keys = list(zip(predictedIntervals, reviewIntervals, repetitions, grades))
+        results = np.array([predictions.get(key, -1) for key in keys], dtype = int)
+
+        misses = np.flatnonzero(results < 0)
+        if len(misses):
+            missingKeys = np.array([keys[i] for i in misses], dtype = float).T
+            inputs = np.array([
+                np.sqrt(missingKeys[0] / self._maxInterval),
+                np.sqrt(missingKeys[1] / self._maxInterval),
+                missingKeys[2] / self._maxRepetition,
+                missingKeys[3] / self._maxGrade
+            ])
+            outputs = self._evaluate(weights, inputs)[0]
+            results[misses] = np.round(np.square(outputs) * self._maxInterval)
+            for i in misses:
+                self._memoize(predictions, keys[i], int(results[i]))
+        return results
+
+    def _memoize(self, predictions, key, prediction):
+        # The memo only grows until it is full; hot input tuples are the ones seen first after each weight swap.
+        if len(predictions) < self.predictionCacheSize:
+            predictions[key] = prediction
 
     def feedBackToNeuralNetwork(self,
                                 lastPredictedInterval,
@@ -113,49 +315,83 @@ class NeuralNetwork:
                                 predictedInterval,
                                 actualInterval,
                                 actualGrade):
-        betterInterval = actualInterval
-        factor = 0.0
-        match actualGrade:
-            case 0:
-                if actualInterval > predictedInterval:
-                    betterInterval = (actualInterval + predictedInterval) / 2
-                factor = 0.4
-            case 1:
-                if actualInterval > predictedInterval:
-                    betterInterval = (actualInterval + predictedInterval) / 2
-                factor = 0.55
-            case 2:
-                if actualInterval > predictedInterval:
-                    betterInterval = (actualInterval + predictedInterval) / 2
-                factor = 0.7
-            case 3:
-                if actualInterval > predictedInterval:
-                    betterInterval = (actualInterval + predictedInterval) / 2
-                factor = 0.85
-            case 4:
-                factor = 1.0
-            case 5:
-                if actualInterval < predictedInterval:
-                    betterInterval = (actualInterval + predictedInterval) / 2
-                factor = 1.2
-            case _:
-                factor = 0.0
-
-        betterInterval *= factor
-
-        self._userCases = np.append(self._userCases, [[
-            self._normalizeInterval(lastPredictedInterval),
-            self._normalizeInterval(reviewInterval),
-            self._normalizeRepetition(repetition),
-            self._normalizeGrade(grade),
-            self._normalizeInterval(betterInterval)
-        ]], axis = 0)
-        self._saveUserCase(lastPredictedInterval, reviewInterval, repetition, grade, betterInterval)
-
-        self._userCases = np.delete(self._userCases, 0, axis = 0)
-
-        self._onlineTraining()
-
+        self.learnFromCases([self.recordFeedback(lastPredictedInterval,
+                                                 reviewInterval,
+                                                 repetition,
+                                                 grade,
+                                                 predictedInterval,
+                                                 actualInterval,
+                                                 actualGrade)])
+
+    def recordFeedback(self,
+                       lastPredictedInterval,
+                       reviewInterval,
+                       repetition,
+                       grade,
+                       predictedInterval,
+                       actualInterval,
+                       actualGrade):
+        return self.recordFeedbacks([(lastPredictedInterval,
+                                      reviewInterval,
+                                      repetition,
+                                      grade,
+                                      predictedInterval,
+                                      actualInterval,
+                                      actualGrade)])[0]
+
+    def recordFeedbacks(self, feedbacks, cardIds = None):
+        # Each feedback is (lastPredictedInterval, reviewInterval, repetition, grade, predictedInterval,
+        # actualInterval, actualGrade); all of them are logged as review events with one INSERT.
+        cases = [self._feedbackCase(*feedback) for feedback in feedbacks]
+
+        ReviewEvent.objects.bulk_create([
+            ReviewEvent(
+                cardId = cardId,
+                lastPredictedInterval = feedback[0],
+                reviewInterval = feedback[1],
+                repetition = feedback[2],
+                grade = feedback[3],
+                predictedInterval = feedback[4],
+                actualInterval = feedback[5],
+                actualGrade = feedback[6])
+            for feedback, cardId in zip(feedbacks, cardIds or [None] * len(feedbacks))])
+        return cases
+
+    def _feedbackCase(self,
+                      lastPredictedInterval,
+                      reviewInterval,
+                      repetition,
+                      grade,
+                      predictedInterval,
+                      actualInterval,
+                      actualGrade):
+        return normalizedInputs(lastPredictedInterval, reviewInterval, repetition, grade) + [
+            feedbackTarget(predictedInterval, actualInterval, actualGrade, self.gradeFactors)
+        ]
+
+    def _normalizedInputs(self, lastPredictedInterval, reviewInterval, repetition, grade):
+        return normalizedInputs(lastPredictedInterval, reviewInterval, repetition, grade)
+
+    def learnFromCases(self, cases):
+        with self._trainingLock:
+            self._learnFromCases(cases)
+
+    def _learnFromCases(self, cases):
+        for case in cases:
+            self._replayMemory.add(case)
+
+        # Train a copy so a failed run leaves the current network untouched.
+        trainer = copy.copy(self)
+        trainer._network = copy.deepcopy(self._network)
+        trainer._userCases = self._replayMemory.cases()
+        trainer._onlineTraining()
+
+        self._network = trainer._network
+        self.version = trainer.version
+        self.latestLearningRate = trainer.latestLearningRate
+        self.latestRMSE = trainer.latestRMSE
+        self.totalSessionEpochs = trainer.totalSessionEpochs
+        self._snapshotWeights()
 
     def _backPropagation(self, expectedInterval):
         networkOutput = self._network[2].outputs[0]
@@ -163,14 +399,8 @@ class NeuralNetwork:
         self._network[2].errors[0] = self._sigmoidDerivative(networkOutput) * networkError
 
         for l in range(len(self._network) - 1, 1, -1):
-            for i in range(0, self._network[l - 1].units):
-                output = self._network[l - 1].outputs[i]
-                error = 0.0
-
-                for j in range(0, self._network[l].units):
-                    error += self._network[l].weights[j][i] * self._network[l].errors[j]
-
-                self._network[l - 1].errors[i] = self._sigmoidDerivative(output) * error
+            self._network[l - 1].errors[:] = \
+            self._sigmoidDerivative(self._network[l - 1].outputs) * (self._network[l].errors @ self._network[l].weights)
 
         return networkError
 
@@ -184,28 +414,50 @@ class NeuralNetwork:
         networkError = self._backPropagation(predictedInterval)
 
         for l in range(1, len(self._network)):
-            for i in range(0, self._network[l].units):
-                for j in range(0, self._network[l - 1].units):
-                    self._network[l].weights[i][j] -= \
-                    self._network[l].errors[i] * self._network[l - 1].outputs[j] * self.latestLearningRate
+            self._network[l].weights -= \
+            np.outer(self._network[l].errors, self._network[l - 1].outputs) * self.latestLearningRate
         
         return networkError
 
-    def _onlineTraining(self, epochFactor = 8, targetRMSE = 0.0125):
+    def _simulateNeuralNetworkBatch(self, cases):
+        outputs = [cases[:, 0:4]]
+        for layer in self._network[1:]:
+            outputs.append(self._sigmoid(outputs[-1] @ layer.weights.T))
+
+        networkErrors = outputs[-1][:, 0] - cases[:, 4]
+        errors = self._sigmoidDerivative(outputs[-1]) * networkErrors[:, np.newaxis]
+
+        for l in range(len(self._network) - 1, 0, -1):
+            gradient = errors.T @ outputs[l - 1] / len(cases)
+            if l > 1:
+                errors = self._sigmoidDerivative(outputs[l - 1]) * (errors @ self._network[l].weights)
+            self._network[l].weights -= gradient * self.latestLearningRate
+
+        return networkErrors
+
+    def _onlineEpoch(self):
+        return [self._simulateNeuralNetwork(case[0], case[1], case[2], case[3], case[4]) for case in self._userCases]
+
+    def _batchEpoch(self):
+        batchSize = self.batchSize or len(self._userCases)
+        return np.concatenate([self._simulateNeuralNetworkBatch(self._userCases[start:start + batchSize])
+                               for start in range(0, len(self._userCases), batchSize)])
+
+    def _onlineTraining(self, epochFactor = None, targetRMSE = None):
+        epochFactor = self.epochFactor if epochFactor is None else epochFactor
+        targetRMSE = self.targetRMSE if targetRMSE is None else targetRMSE
         if self._userCases.size == 0:
             return
         
         totalEpochs = epochFactor * self._userCases.size
         epochCounter = 1
+        runEpoch = self._batchEpoch if self.trainingMode == 'batch' else self._onlineEpoch
 
         while True:
-            networkErrors = []
-
-            for case in self._userCases:
-                networkErrors.append(self._simulateNeuralNetwork(case[0], case[1], case[2], case[3], case[4]))
+            networkErrors = runEpoch()
 
             self.latestRMSE = self._rootedMeanSquaredError(networkErrors)
-            self.latestLearningRate = 0.9 if self.latestRMSE >= 0.02 else 0.1
+            self.latestLearningRate = self.learningRates[0] if self.latestRMSE >= self.learningRateThreshold else self.learningRates[1]
             self.totalSessionEpochs += 1
 
             shuffle(self._userCases)
@@ -215,4 +467,5 @@ class NeuralNetwork:
             
             epochCounter += 1
 
-        self._saveWeights()
\ No newline at end of file
+        if self.persistent:
+            self._saveWeights(epochCounter)
\ No newline at end of file
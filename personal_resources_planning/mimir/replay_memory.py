@@ -0,0 +1,50 @@
+import numpy as np
+
+
+class ReplayMemory:
+    # Fixed-capacity circular buffer of normalized training cases
+    # (lastPredictedInterval, reviewInterval, repetition, grade, predictedInterval).
+    # A case whose four inputs are already stored is averaged into the stored target instead of taking a new slot;
+    # once full, the oldest slot is overwritten. The pinned cases (e.g. aggregates of compacted reviews) take the
+    # first slots and are never overwritten, only averaged into.
+
+    def __init__(self, capacity, pinnedCases = ()):
+        if capacity < 1:
+            raise ValueError('Replay memory capacity must be at least 1')
+        if len(pinnedCases) >= capacity:
+            raise ValueError('Pinned cases must leave at least one slot of the replay memory')
+
+        self.capacity = capacity
+        self.size = 0
+        self.pinned = 0
+        self._cases = np.zeros((capacity, 5))
+        self._keys = [None] * capacity
+        self._slots = {}
+        self._next = 0
+
+        for case in pinnedCases:
+            self.add(case)
+        self.pinned = self.size
+
+    def __len__(self):
+        return self.size
+
+    def add(self, case):
+        key = (case[0], case[1], case[2], case[3])
+        slot = self._slots.get(key)
+        if slot is not None:
+            self._cases[slot, 4] = (self._cases[slot, 4] + case[4]) / 2
+            return
+
+        slot = self._next
+        if self._keys[slot] is not None:
+            del self._slots[self._keys[slot]]
+
+        self._cases[slot] = case
+        self._keys[slot] = key
+        self._slots[key] = slot
+        self._next = slot + 1 if slot + 1 < self.capacity else self.pinned
+        self.size = min(self.size + 1, self.capacity)
+
+    def cases(self):
+        return self._cases[:self.size].copy()
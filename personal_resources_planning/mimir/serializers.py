@@ -1,3 +1,7 @@
+from datetime import date
+from django.db import transaction
+from django.db.models import Count, F, Value, Window
+from django.db.models.functions import Concat, RowNumber, Substr
 from rest_framework import serializers
 from mimir.models import Category, Card, CardType
 
@@ -38,18 +42,148 @@ class CardSerializer(serializers.Serializer):
     
 class CategorySerializer(serializers.ModelSerializer):
 
-    cards = CardSerializer(many=True)
+    cards = CardSerializer(many=True, read_only=True)
 
     def to_representation(self, instance):
         if instance.id > 0:
             self.fields['children'] = CategorySerializer(many=True, read_only=True)
         return super(CategorySerializer, self).to_representation(instance)
 
+    def validate_parentCategory(self, value):
+        if self.instance is not None and value.path.startswith(self.instance.path):
+            raise serializers.ValidationError('A category cannot be moved under itself or one of its subcategories.')
+        return value
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        oldPath = instance.path
+        newPath = f'{validated_data.get("parentCategory", instance.parentCategory).path}{instance.id}/'
+        if newPath != oldPath:
+            # Moving a category re-roots the paths of its whole subtree in one UPDATE.
+            Category.objects.descendantsOf(instance).update(path=Concat(Value(newPath), Substr('path', len(oldPath) + 1)))
+            validated_data['path'] = newPath
+        return super(CategorySerializer, self).update(instance, validated_data)
+
     class Meta:
         model = Category
         fields = ['id', 'name', 'createdOn', 'updatedOn', 'parentCategory', 'ordered', 'cards']
         read_only_fields = ['id', 'createdOn', 'updatedOn']
     
+class CategoryNodeSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'createdOn', 'updatedOn', 'parentCategory', 'ordered']
+
+class KnowledgeTreeSerializer(serializers.BaseSerializer):
+    # Renders the same tree as CategorySerializer, but links it in memory from one query for all categories and
+    # one for all cards instead of querying children and cards of every category.
+
+    def to_representation(self, instance):
+        categorySerializer = CategoryNodeSerializer()
+        cardSerializer = CardSerializer()
+
+        nodes = {}
+        parents = []
+        for category in Category.objects.order_by('id'):
+            node = categorySerializer.to_representation(category)
+            node['cards'] = []
+            if category.id > 0:
+                node['children'] = []
+            nodes[category.id] = node
+            parents.append((category.id, category.parentCategory_id))
+
+        for categoryId, parentId in parents:
+            if parentId > 0 and parentId != categoryId:
+                nodes[parentId]['children'].append(nodes[categoryId])
+
+        for card in Card.objects.order_by('id'):
+            nodes[card.category_id]['cards'].append(cardSerializer.to_representation(card))
+
+        return nodes[instance.id]
+
+class KnowledgeTreeQuerySerializer(serializers.Serializer):
+    node = serializers.IntegerField(min_value=1, default=1)
+    depth = serializers.IntegerField(min_value=0, required=False)
+    cardLimit = serializers.IntegerField(min_value=1, max_value=1000, required=False)
+    cardCursor = serializers.IntegerField(min_value=0, required=False)
+    omitBody = serializers.BooleanField(default=False)
+
+class KnowledgeSubtreeSerializer(serializers.BaseSerializer):
+    # Renders part of the tree under a category: children down to context['depth'] levels (every level when absent),
+    # at most context['cardLimit'] cards per category and, with context['omitBody'], cards without front and back.
+    # Every category also gets childCount and, when it has more cards, nextCardCursor; passing that back as
+    # context['cardCursor'] pages through the cards of the requested category.
+
+    def to_representation(self, instance):
+        depth = self.context.get('depth')
+        cardLimit = self.context.get('cardLimit')
+        cardCursor = self.context.get('cardCursor')
+        omitBody = self.context.get('omitBody', False)
+
+        categorySerializer = CategoryNodeSerializer()
+        cardSerializer = CardSerializer()
+        if omitBody:
+            del cardSerializer.fields['front']
+            del cardSerializer.fields['back']
+
+        nodes = {}
+        level = [instance]
+        levelCounter = 0
+        while level:
+            for category in level:
+                node = categorySerializer.to_representation(category)
+                node['childCount'] = category.childCount
+                node['cards'] = []
+                node['nextCardCursor'] = None
+                if depth is None or levelCounter < depth:
+                    node['children'] = []
+                if category.id != instance.id:
+                    nodes[category.parentCategory_id]['children'].append(node)
+                nodes[category.id] = node
+
+            if depth is not None and levelCounter == depth:
+                break
+            level = list(Category.objects.filter(parentCategory__in=[category.id for category in level])
+                         .exclude(id=F('parentCategory')).annotate(childCount=Count('children')).order_by('id'))
+            levelCounter += 1
+
+        cards = Card.objects.filter(category__in=list(nodes))
+        if cardCursor is not None:
+            cards = cards.exclude(category=instance.id, id__lte=cardCursor)
+        if omitBody:
+            cards = cards.defer('front', 'back')
+        if cardLimit is not None:
+            # One row past the limit tells whether a category has another page.
+            cards = cards.annotate(rank=Window(RowNumber(), partition_by=F('category'), order_by=F('id').asc())) \
+                .filter(rank__lte=cardLimit + 1)
+
+        for card in cards.order_by('id'):
+            node = nodes[card.category_id]
+            if cardLimit is not None and len(node['cards']) == cardLimit:
+                node['nextCardCursor'] = node['cards'][-1]['id']
+                continue
+            node['cards'].append(cardSerializer.to_representation(card))
+
+        return nodes[instance.id]
+
+class DueCardsQuerySerializer(serializers.Serializer):
+    category = serializers.IntegerField(min_value=1, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=100)
+    cursor = serializers.CharField(required=False)
+
+    def validate_cursor(self, value):
+        # A cursor is the (nextReviewOn, category, id) of the last card of the previous page.
+        try:
+            nextReviewOn, category, id = value.split(',')
+            return date.fromisoformat(nextReviewOn), int(category), int(id)
+        except ValueError:
+            raise serializers.ValidationError('Invalid cursor.')
+
 class ReviewSerializer(serializers.Serializer):
     cardId = serializers.IntegerField(min_value=1)
-    actualGrade = serializers.IntegerField(min_value=0, max_value=5)
\ No newline at end of file
+    actualGrade = serializers.IntegerField(min_value=0, max_value=5)
+
+class SyncQuerySerializer(serializers.Serializer):
+    # since is the cursor returned by the previous sync; without it every card and category is returned.
+    since = serializers.DateTimeField(required=False)
\ No newline at end of file
@@ -0,0 +1,267 @@
+import django
+import itertools
+import math
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from django.db import connections
+from mimir.neural_network import MAX_INTERVAL, NeuralNetwork, normalizedInputs
+
+# Offline evaluation of scheduler configurations. A configuration is a dict of NeuralNetwork keyword arguments; the
+# networks built here are not persistent, so simulations run without a database (e.g. in pool worker processes).
+#
+# Sweeps train on an exported case matrix instead: rows of normalized (lastPredictedInterval, reviewInterval,
+# repetition, grade, predictedInterval) cases, like the ones in the replay memory.
+#
+# Both simulations are prequential: every day's reviews are first predicted with the current network, then the
+# reviewed cards are rescheduled like /review does and the network is retrained on the feedback gathered since its
+# last training run, once every trainEvery days.
+
+CONFIG_KEYS = ('trainingMode', 'batchSize', 'replayCapacity', 'hiddenUnits', 'learningRates', 'learningRateThreshold',
+               'gradeFactors', 'epochFactor', 'targetRMSE')
+# The arguments that matter when training on a case matrix, whose targets already include the grade factors.
+TRAINING_KEYS = ('trainingMode', 'batchSize', 'hiddenUnits', 'learningRates', 'learningRateThreshold', 'epochFactor',
+                 'targetRMSE')
+
+# Columns of a review history: the day of the review, then the feedback
+# (lastPredictedInterval, reviewInterval, repetition, grade, predictedInterval, actualInterval, actualGrade).
+DAY, LAST_PREDICTED_INTERVAL, REVIEW_INTERVAL, REPETITION, GRADE, PREDICTED_INTERVAL, ACTUAL_INTERVAL, ACTUAL_GRADE = range(8)
+
+
+def randomWeights(hiddenUnits, seed):
+    # Initial weights for networks that cannot start from the active ones. The output weights are negative on
+    # average, so new cards start at intervals of a few days (as with the initial weights) instead of ~500 days.
+    rng = np.random.default_rng(seed)
+    return np.concatenate([rng.normal(0.0, 1.0, hiddenUnits * 4),
+                           rng.normal(-6.0 / hiddenUnits, 1.0 / np.sqrt(hiddenUnits), hiddenUnits)])
+
+
+def initialWeights(configs, activeWeights = None, seed = 0):
+    # The weights every (name, config) starts from: all start from the same kind of weights, or a comparison measures
+    # the starting points. These are the active network weights, which only fit configurations keeping its hidden
+    # layer size, or random ones when activeWeights is None.
+    if activeWeights is None:
+        return [randomWeights(config.get('hiddenUnits', 20), seed) for _, config in configs]
+    mismatched = [name for name, config in configs if config.get('hiddenUnits', 20) * 5 != len(activeWeights)]
+    if mismatched:
+        raise ValueError(f'The active network weights do not fit {", ".join(mismatched)}')
+    return [activeWeights] * len(configs)
+
+
+def runJobs(function, jobs, workers):
+    # Maps function over the jobs in up to workers processes; a single worker runs them in this process.
+    workers = max(1, min(workers or 1, len(jobs)))
+    if workers == 1:
+        return [function(job) for job in jobs]
+    # Forked workers must not share this process' database connections.
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+        return list(executor.map(function, jobs))
+
+
+def pretrainingCases(nn):
+    # Inputs spread over the usual range, each with the interval nn predicts for it as target.
+    intervals = (0, 2, 7, 30, 120)
+    inputs = list(itertools.product(intervals, intervals, (0, 1, 3, 8), range(6)))
+    predicted = nn.predictNextIntervals(*np.array(inputs).T)
+    return np.array([normalizedInputs(*caseInputs) + [math.sqrt(interval / MAX_INTERVAL)]
+                     for caseInputs, interval in zip(inputs, predicted.tolist())])
+
+
+def pretrainedWeights(config, weights, cases, epochs, seed):
+    # Fits a network to cases (e.g. the predictions of the active network) for a number of epochs, so networks
+    # starting from random weights schedule alike before a simulation. Returns the weights and the final RMSE.
+    nn = NeuralNetwork(**config, weights=weights, persistent=False)
+    nn._userCases = cases.copy()
+    np.random.seed(seed)
+    runEpoch = nn._batchEpoch if nn.trainingMode == 'batch' else nn._onlineEpoch
+    rmse = None
+    for _ in range(epochs):
+        rmse = nn._rootedMeanSquaredError(runEpoch())
+        nn.latestLearningRate = nn.learningRates[0] if rmse >= nn.learningRateThreshold else nn.learningRates[1]
+        np.random.shuffle(nn._userCases)
+    return nn.packedWeights(), rmse
+
+
+def replayHistory(config, weights, history, trainEvery = 1):
+    # Replays a recorded review history (sorted by day). Workload is the number of reviews per day that the
+    # intervals predicted by this configuration would have scheduled.
+    start = time.process_time()
+    nn = NeuralNetwork(**config, weights=weights, persistent=False)
+    errors = _PredictionErrors(nn)
+    trainer = _Trainer(nn, trainEvery)
+    dueDays = []
+
+    for day, batch in _days(history):
+        errors.add(batch)
+        nextIntervals = nn.predictNextIntervals(batch[:, PREDICTED_INTERVAL],
+                                                np.minimum(batch[:, ACTUAL_INTERVAL], 2048),
+                                                np.minimum(batch[:, REPETITION] + 1, 128),
+                                                batch[:, ACTUAL_GRADE])
+        dueDays.append(day + nextIntervals)
+        trainer.add(day, batch)
+
+    lastDay = int(history[-1, DAY]) if len(history) else 0
+    dueDays = np.concatenate(dueDays) if dueDays else np.zeros(0, dtype = int)
+    workload = np.bincount(dueDays[dueDays <= lastDay], minlength = lastDay + 1)
+    return {'reviews': len(history), **errors.summary(), **_workload(workload), **_training(nn, start)}
+
+
+def simulatePopulation(config, weights, cards, days, seed, trainEvery = 1):
+    # Synthetic learners: every card has a memory stability S (in days) and is recalled after t days with
+    # probability exp(-t / S). Recalls grow the stability, the more the less likely they were; lapses shrink it.
+    # New cards are added over the first half of the simulated days.
+    start = time.process_time()
+    rng = np.random.default_rng(seed)
+    nn = NeuralNetwork(**config, weights=weights, persistent=False)
+    errors = _PredictionErrors(nn)
+    trainer = _Trainer(nn, trainEvery)
+
+    stability = rng.lognormal(0.5, 0.6, cards)
+    createdOn = np.sort(rng.integers(0, max(days // 2, 1), cards))
+    lastPredictedInterval = np.zeros(cards, dtype = int)
+    reviewInterval = np.zeros(cards, dtype = int)
+    repetition = np.zeros(cards, dtype = int)
+    grade = np.zeros(cards, dtype = int)
+    predictedInterval = np.full(cards, nn.predictNextInterval(0, 0, 0, 0))
+    lastReviewOn = createdOn.copy()
+    nextReviewOn = createdOn + predictedInterval
+
+    workload = np.zeros(days, dtype = int)
+    recalls = 0
+    for day in range(days):
+        due = np.flatnonzero((nextReviewOn <= day) & (createdOn < day))
+        if len(due) == 0:
+            continue
+
+        elapsed = np.minimum(day - lastReviewOn[due], 2048)
+        retrievability = np.exp(-elapsed / stability[due])
+        recalled = rng.random(len(due)) < retrievability
+        actualGrade = np.where(recalled, 3 + (retrievability > 0.8) + (retrievability > 0.95), rng.integers(0, 3, len(due)))
+        stability[due] = np.where(recalled, stability[due] * (1.2 + 2.5 * (1.0 - retrievability)),
+                                  np.maximum(stability[due] * 0.4, 0.5))
+
+        batch = np.column_stack([np.full(len(due), day), lastPredictedInterval[due], reviewInterval[due], repetition[due],
+                                 grade[due], predictedInterval[due], elapsed, actualGrade])
+        errors.add(batch)
+
+        # Rescheduled like /review; a card predicted for the same day is reviewed again the next day.
+        nextIntervals = nn.predictNextIntervals(predictedInterval[due], elapsed, np.minimum(repetition[due] + 1, 128), actualGrade)
+        lastPredictedInterval[due] = predictedInterval[due]
+        reviewInterval[due] = elapsed
+        repetition[due] = np.minimum(repetition[due] + 1, 128)
+        grade[due] = actualGrade
+        predictedInterval[due] = nextIntervals
+        lastReviewOn[due] = day
+        nextReviewOn[due] = day + np.maximum(nextIntervals, 1)
+
+        workload[day] = len(due)
+        recalls += int(recalled.sum())
+        trainer.add(day, batch)
+
+    reviews = int(workload.sum())
+    return {'reviews': reviews, 'retention': recalls / reviews if reviews else None, **errors.summary(),
+            **_workload(workload), **_training(nn, start)}
+
+
+def runSimulation(job):
+    # Entry point for pool workers: job is (name, config, weights, pretraining, source, arguments), pretraining
+    # being None or the (cases, epochs, seed) arguments of pretrainedWeights. Pretraining is not part of the timings.
+    name, config, weights, pretraining, source, arguments = job
+    pretrainingRMSE = None
+    if pretraining is not None:
+        weights, pretrainingRMSE = pretrainedWeights(config, weights, *pretraining)
+
+    wallStart = time.perf_counter()
+    if source == 'log':
+        result = replayHistory(config, weights, *arguments)
+    else:
+        result = simulatePopulation(config, weights, *arguments)
+    return {'name': name, 'config': config, 'pretrainingRMSE': pretrainingRMSE, **result,
+            'wallSeconds': time.perf_counter() - wallStart}
+
+
+def trainOnCases(job):
+    # Entry point for pool workers: job is (name, config, weights, trainingCases, validationCases, seed). A single
+    # training run on the training cases, like the one that follows a review, timed until it converges or gives up.
+    name, config, weights, trainingCases, validationCases, seed = job
+    nn = NeuralNetwork(**config, weights=weights, persistent=False)
+    nn._userCases = trainingCases.copy()
+    np.random.seed(seed)
+
+    cpuStart = time.process_time()
+    wallStart = time.perf_counter()
+    nn._onlineTraining()
+    return {'name': name, 'config': config, 'epochs': nn.totalSessionEpochs, 'converged': nn.latestRMSE <= nn.targetRMSE,
+            'trainingRMSE': nn.latestRMSE, 'validationRMSE': _caseRMSE(nn, validationCases),
+            'cpuSeconds': time.process_time() - cpuStart, 'wallSeconds': time.perf_counter() - wallStart}
+
+
+def _caseRMSE(nn, cases):
+    if len(cases) == 0:
+        return None
+    outputs = cases[:, 0:4]
+    for layer in nn._network[1:]:
+        outputs = nn._sigmoid(outputs @ layer.weights.T)
+    return float(np.sqrt(np.mean(np.square(outputs[:, 0] - cases[:, 4]))))
+
+
+def _days(history):
+    if len(history) == 0:
+        return
+    boundaries = np.flatnonzero(np.diff(history[:, DAY])) + 1
+    for batch in np.split(history, boundaries):
+        yield int(batch[0, DAY]), batch
+
+
+def _workload(workload):
+    activeDays = workload[np.flatnonzero(workload)[0]:] if workload.any() else workload
+    return {'workloadMean': float(activeDays.mean()) if len(activeDays) else 0.0,
+            'workloadP95': float(np.percentile(activeDays, 95)) if len(activeDays) else 0.0,
+            'workloadMax': int(activeDays.max()) if len(activeDays) else 0}
+
+
+def _training(nn, start):
+    return {'trainingRMSE': nn.latestRMSE, 'epochs': nn.totalSessionEpochs, 'cpuSeconds': time.process_time() - start}
+
+
+class _Trainer:
+
+    def __init__(self, nn, trainEvery):
+        self._nn = nn
+        self._trainEvery = trainEvery
+        self._cases = []
+        self._lastTrainedOn = None
+
+    def add(self, day, batch):
+        self._cases.extend(self._nn._feedbackCase(*feedback) for feedback in batch[:, LAST_PREDICTED_INTERVAL:].tolist())
+        if self._lastTrainedOn is None or day - self._lastTrainedOn >= self._trainEvery:
+            self._nn.learnFromCases(self._cases)
+            self._cases = []
+            self._lastTrainedOn = day
+
+
+class _PredictionErrors:
+    # Compares what the network predicts for each review's inputs with the better interval derived from the review,
+    # before the network has learned from it.
+
+    def __init__(self, nn):
+        self._nn = nn
+        self._normalizedErrors = []
+        self._intervalErrors = []
+
+    def add(self, batch):
+        predicted = self._nn.predictNextIntervals(batch[:, LAST_PREDICTED_INTERVAL], batch[:, REVIEW_INTERVAL],
+                                                  batch[:, REPETITION], batch[:, GRADE])
+        targets = np.array([self._nn._feedbackCase(*feedback)[4] for feedback in batch[:, LAST_PREDICTED_INTERVAL:].tolist()])
+        self._normalizedErrors.append(np.sqrt(predicted / self._nn._maxInterval) - targets)
+        self._intervalErrors.append(predicted - np.square(targets) * self._nn._maxInterval)
+
+    def summary(self):
+        if not self._normalizedErrors:
+            return {'rmse': None, 'intervalMAE': None, 'intervalMedianAE': None}
+        normalizedErrors = np.concatenate(self._normalizedErrors)
+        intervalErrors = np.abs(np.concatenate(self._intervalErrors))
+        return {'rmse': float(np.sqrt(np.mean(np.square(normalizedErrors)))),
+                'intervalMAE': float(intervalErrors.mean()),
+                'intervalMedianAE': float(np.median(intervalErrors))}
@@ -1,3 +1,337 @@
+import importlib
+import math
+import time
+from datetime import date, datetime, timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError
 from django.test import TestCase
+from django.urls import clear_url_caches, resolve
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+import mimir.urls
+from mimir import async_views
+from mimir.management.commands.sweephyperparameters import Command as SweepCommand
+from mimir.model_sync import ModelGeneration
+from mimir.models import Card, Category, NeuralNetworkWeight, Tombstone
+from mimir.neural_network import NeuralNetwork, normalizedInputs
+from mimir.replay_memory import ReplayMemory
+from mimir.serializers import CategorySerializer, KnowledgeTreeSerializer
+from mimir.tree_cache import cachedKnowledgeTree
 
 # Create your tests here.
+
+class CategoryTreeTestCase(TestCase):
+    fixtures = ['initial']
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='test'))
+        self.root = Category.objects.get(id=1)
+
+    def _category(self, name, parent, id = None):
+        if id is not None:
+            return Category.objects.create(id=id, name=name, parentCategory=parent, ordered=1, path=f'{parent.path}{id}/')
+        serializer = CategorySerializer(data={'name': name, 'parentCategory': parent.id, 'ordered': 1})
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def _card(self, category):
+        return Card.objects.create(front='Front', back='Back', category=category, cardType_id='Fact', ordered=1,
+                                   lastPredictedInterval=0, reviewInterval=0, repetition=0, grade=0,
+                                   predictedInterval=1, nextReviewOn=date.today())
+
+    def _move(self, category, parent):
+        return self.client.put(f'/mimir/category/{category.id}',
+                               {'name': category.name, 'parentCategory': parent.id, 'ordered': category.ordered},
+                               format='json')
+
+    def _ids(self, queryset):
+        return set(queryset.values_list('id', flat=True))
+
+class CategoryPathTests(CategoryTreeTestCase):
+
+    def test_queries_follow_a_moved_subtree(self):
+        a = self._category('a', self.root)
+        b = self._category('b', a)
+        c = self._category('c', b)
+        d = self._category('d', self.root)
+
+        response = self._move(b, d)
+        self.assertEqual(response.status_code, 201)
+        b.refresh_from_db()
+        c.refresh_from_db()
+
+        self.assertEqual(c.path, f'/0/1/{d.id}/{b.id}/{c.id}/')
+        self.assertEqual(self._ids(Category.objects.subtreeOf(d)), {d.id, b.id, c.id})
+        self.assertEqual(self._ids(Category.objects.subtreeOf(a)), {a.id})
+        self.assertEqual(self._ids(Category.objects.descendantsOf(b)), {c.id})
+        self.assertEqual(self._ids(Category.objects.ancestorsOf(c)), {0, 1, d.id, b.id})
+
+    def test_subtree_excludes_siblings_sharing_an_id_prefix(self):
+        two = self._category('2', self.root, id=2)
+        twenty = self._category('20', self.root, id=20)
+        child = self._category('21', two, id=21)
+
+        self.assertEqual(self._ids(Category.objects.subtreeOf(two)), {two.id, child.id})
+        self.assertEqual(self._ids(Category.objects.subtreeOf(twenty)), {twenty.id})
+
+    def test_rejects_moving_a_category_under_itself_or_a_descendant(self):
+        a = self._category('a', self.root)
+        b = self._category('b', a)
+        c = self._category('c', b)
+        paths = dict(Category.objects.values_list('id', 'path'))
+
+        for parent in (a, c):
+            response = self._move(a, parent)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('parentCategory', response.data)
+        self.assertEqual(dict(Category.objects.values_list('id', 'path')), paths)
+
+    def test_saving_a_new_category_sets_its_path(self):
+        a = Category.objects.create(name='a', parentCategory=self.root, ordered=1)
+        b = Category.objects.create(name='b', parentCategory=a, ordered=1)
+
+        self.assertEqual(b.path, f'/0/1/{a.id}/{b.id}/')
+        self.assertEqual(Category.objects.get(id=b.id).path, b.path)
+
+    def test_refuses_empty_paths(self):
+        a = self._category('a', self.root)
+
+        with self.assertRaises(ValueError):
+            Category.objects.subtreeOf(Category(id=a.id, path=''))
+        with self.assertRaises(ValueError):
+            Category.objects.descendantsOf(Category(id=a.id, path=''))
+        with self.assertRaises(IntegrityError):
+            Category.objects.filter(id=a.id).update(path='')
+
+class CategoryDeleteTests(CategoryTreeTestCase):
+
+    def test_deletes_exactly_the_subtree(self):
+        a = self._category('a', self.root, id=2)
+        b = self._category('b', a)
+        c = self._category('c', b)
+        sibling = self._category('sibling', self.root, id=20)
+        for category in (a, b, c):
+            self._card(category)
+        keptCards = {self._card(category).id for category in (self.root, sibling)}
+        categories = self._ids(Category.objects.all())
+
+        response = self.client.delete(f'/mimir/category/{a.id}')
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self._ids(Category.objects.all()), categories - {a.id, b.id, c.id})
+        self.assertEqual(self._ids(Card.objects.all()), keptCards)
+
+    def test_writes_tombstones_for_the_whole_subtree(self):
+        a = self._category('a', self.root, id=2)
+        b = self._category('b', a)
+        self._category('sibling', self.root, id=20)
+        removedCards = {self._card(category).id for category in (a, b, b)}
+        self._card(self.root)
+
+        self.client.delete(f'/mimir/category/{a.id}')
+
+        self.assertEqual(set(Tombstone.objects.filter(model=Tombstone.CATEGORY).values_list('objectId', flat=True)),
+                         {a.id, b.id})
+        self.assertEqual(set(Tombstone.objects.filter(model=Tombstone.CARD).values_list('objectId', flat=True)),
+                         removedCards)
+
+class SyncTests(CategoryTreeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Everything created before the first sync, outside of the cursor overlap.
+        self.old = self._category('old', self.root)
+        self.oldChild = self._category('old child', self.old)
+        self.oldCard = self._card(self.old)
+        self.oldChildCards = {self._card(self.oldChild).id, self._card(self.oldChild).id}
+        anHourAgo = datetime.now() - timedelta(hours=1)
+        Category.objects.filter(id__in=[self.old.id, self.oldChild.id]).update(createdOn=anHourAgo, updatedOn=anHourAgo)
+        Card.objects.update(createdOn=anHourAgo, updatedOn=anHourAgo)
+
+    def _sync(self, since = None):
+        response = self.client.get('/mimir/sync', {'since': since} if since is not None else {})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_first_sync_returns_everything(self):
+        changes = self._sync()
+
+        self.assertEqual({category['id'] for category in changes['categories']}, self._ids(Category.objects.all()))
+        self.assertEqual({card['id'] for card in changes['cards']}, self._ids(Card.objects.all()))
+        self.assertEqual(changes['deleted'], {'categories': [], 'cards': []})
+
+    def test_returns_the_changes_after_the_cursor(self):
+        cursor = self._sync()['cursor']
+        unchanged = self._sync(cursor)
+        self.assertEqual((unchanged['categories'], unchanged['cards'], unchanged['deleted']),
+                         ([], [], {'categories': [], 'cards': []}))
+
+        created = self._category('new', self.root)
+        response = self.client.put(f'/mimir/card/{self.oldCard.id}',
+                                   {'front': 'Changed', 'category': self.old.id, 'cardType': 'Fact', 'ordered': 1},
+                                   format='json')
+        self.assertEqual(response.status_code, 200)
+        self.client.delete(f'/mimir/category/{self.oldChild.id}')
+
+        changes = self._sync(cursor)
+        self.assertEqual([category['id'] for category in changes['categories']], [created.id])
+        self.assertEqual([card['id'] for card in changes['cards']], [self.oldCard.id])
+        self.assertEqual(changes['cards'][0]['front'], 'Changed')
+        self.assertEqual(changes['deleted']['categories'], [self.oldChild.id])
+        self.assertEqual(set(changes['deleted']['cards']), self.oldChildCards)
+
+    def test_lists_every_card_and_category_of_a_deleted_subtree(self):
+        cursor = self._sync()['cursor']
+        self.client.delete(f'/mimir/category/{self.old.id}')
+
+        changes = self._sync(cursor)
+        self.assertEqual(set(changes['deleted']['categories']), {self.old.id, self.oldChild.id})
+        self.assertEqual(set(changes['deleted']['cards']), {self.oldCard.id} | self.oldChildCards)
+
+    def test_rejects_an_invalid_cursor(self):
+        response = self.client.get('/mimir/sync', {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+class AsyncViewsTests(CategoryTreeTestCase):
+    fixtures = ['initial', 'neural_network_weight']
+
+    def _useAsyncViews(self, enabled):
+        # mimir.urls picks the views module when it is imported; the root URLconf keeps the patterns it included.
+        with self.settings(MIMIR_ASYNC_VIEWS=enabled):
+            importlib.reload(mimir.urls)
+        importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+        clear_url_caches()
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(self._useAsyncViews, settings.MIMIR_ASYNC_VIEWS)
+        self.card = self._card(self._category('a', self.root))
+
+    def _responses(self, asyncViews):
+        self._useAsyncViews(asyncViews)
+        requests = [
+            ('get', f'/mimir/card/{self.card.id}', None),
+            ('get', '/mimir/card/999999', None),
+            ('put', f'/mimir/card/{self.card.id}', {'front': 'Changed'}),
+            ('post', '/mimir/review/batch', [{'cardId': self.card.id, 'actualGrade': 3}] * 2),
+            ('post', '/mimir/review/batch', [{'cardId': self.card.id, 'actualGrade': 3}, {'cardId': 999999, 'actualGrade': 3}]),
+            ('post', '/mimir/review', {'cardId': 999999, 'actualGrade': 3}),
+            ('post', '/mimir/review', {'cardId': self.card.id, 'actualGrade': 9}),
+            ('get', '/mimir/due', {'limit': 0}),
+            ('get', '/mimir/due', {'category': 999999}),
+            ('get', '/mimir/sync', {'since': 'yesterday'}),
+            ('get', '/mimir/knowledgeTree', {'node': 999999}),
+            ('get', '/mimir/knowledgeTree', {'node': 1, 'depth': 1, 'omitBody': True}),
+            ('post', '/mimir/category', {'name': 'b'}),
+        ]
+        return [(response.status_code, response.content) for response in
+                (getattr(self.client, method)(url, data, format='json') if method != 'get' else self.client.get(url, data)
+                 for method, url, data in requests)]
+
+    def test_answers_like_the_drf_views(self):
+        self._useAsyncViews(True)
+        self.assertIs(resolve('/mimir/due').func, async_views.dueCards)
+        self.assertEqual(self._responses(asyncViews=True), self._responses(asyncViews=False))
+
+    def test_creates_and_deletes_through_the_async_views(self):
+        self._useAsyncViews(True)
+        self.assertIs(resolve('/mimir/card').func, async_views.createCard)
+        response = self.client.post('/mimir/card', {'front': 'Front', 'category': self.root.id, 'cardType': 'Fact',
+                                                    'ordered': 1}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Card.objects.filter(id=response.data['id']).exists())
+
+        response = self.client.delete(f'/mimir/card/{response.data["id"]}')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(Tombstone.objects.filter(model=Tombstone.CARD).count(), 1)
+
+class KnowledgeTreeSerializerTests(CategoryTreeTestCase):
+
+    def test_renders_the_same_bytes_as_category_serializer(self):
+        a = self._category('a', self.root)
+        b = self._category('b', a)
+        d = self._category('d', self.root)
+        for category in (self.root, a, b, b, d):
+            self._card(category)
+        self._move(b, d)
+
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(KnowledgeTreeSerializer(self.root).data),
+                         renderer.render(CategorySerializer(self.root).data))
+
+class KnowledgeTreeCacheTests(CategoryTreeTestCase):
+
+    def test_follows_a_generation_published_by_another_process(self):
+        a = self._category('a', self.root)
+        cachedKnowledgeTree()
+
+        # Another process changes the tree through the database and publishes a new generation.
+        Category.objects.filter(id=a.id).update(name='renamed')
+        ModelGeneration(settings.MIMIR_TREE_GENERATION_FILE).publish(time.time_ns())
+
+        etag, data = cachedKnowledgeTree()
+        self.assertEqual([child['name'] for child in data['children']], ['renamed'])
+
+class NeuralNetworkTests(TestCase):
+    # Expected values computed with the original loop-based implementation from the fixture weights.
+    fixtures = ['neural_network_weight']
+
+    def setUp(self):
+        weights = NeuralNetworkWeight.objects.order_by('id').values_list('weight', flat=True)
+        self.nn = NeuralNetwork(weights=list(weights), persistent=False)
+
+    def test_predicts_known_intervals(self):
+        predictions = {(0, 0, 0, 0): 0, (1, 1, 1, 3): 4, (5, 4, 2, 4): 18, (30, 28, 5, 2): 7, (200, 180, 10, 5): 397}
+
+        for inputs, interval in predictions.items():
+            self.assertEqual(self.nn.predictNextInterval(*inputs), interval)
+        self.assertEqual(self.nn.predictNextIntervals(*zip(*predictions)).tolist(), list(predictions.values()))
+
+    def test_one_training_step_matches_known_weights(self):
+        self.nn.latestLearningRate = 0.9
+        case = normalizedInputs(5, 4, 2, 4) + [math.sqrt(12 / 2048)]
+
+        self.assertAlmostEqual(self.nn._simulateNeuralNetwork(*case), 0.017237240691559866, places=12)
+        weights = self.nn.packedWeights()
+        self.assertAlmostEqual(weights.sum(), -49.14276611571026, places=10)
+        self.assertAlmostEqual(weights[0], 1.4726129887273574, places=12)
+        self.assertAlmostEqual(weights[-1], -1.3988541032841324, places=12)
+        self.assertAlmostEqual(self.nn._propagation(*case[:4]), 0.09327258481942273, places=12)
+
+class ReplayMemoryTests(TestCase):
+
+    def test_averages_duplicates_and_overwrites_the_oldest_case(self):
+        memory = ReplayMemory(3)
+        for grade in range(4):
+            memory.add([0.0, 0.0, 0.0, grade, 0.5])
+        memory.add([0.0, 0.0, 0.0, 3, 0.1])
+
+        self.assertEqual(len(memory), 3)
+        self.assertEqual(sorted(case[3] for case in memory.cases()), [1, 2, 3])
+        self.assertAlmostEqual(dict((case[3], case[4]) for case in memory.cases())[3], 0.3)
+
+    def test_never_overwrites_pinned_cases(self):
+        memory = ReplayMemory(3, [[1.0, 0.0, 0.0, 0.0, 0.2]])
+        for grade in range(5):
+            memory.add([0.0, 0.0, 0.0, grade, 0.5])
+
+        self.assertEqual(memory.pinned, 1)
+        self.assertEqual(memory.cases()[0].tolist(), [1.0, 0.0, 0.0, 0.0, 0.2])
+        self.assertEqual(sorted(case[3] for case in memory.cases()[1:]), [3, 4])
+
+class SweepRankingTests(TestCase):
+
+    def _result(self, name, converged, cpuSeconds, validationRMSE):
+        return {'name': name, 'converged': converged, 'cpuSeconds': cpuSeconds, 'trainingRMSE': 0.5,
+                'validationRMSE': validationRMSE}
+
+    def test_ranks_runs_that_never_converged_by_error_after_the_converged_ones(self):
+        results = [self._result('slow', True, 9.0, 0.3), self._result('stuck fast', False, 1.0, 0.4),
+                   self._result('stuck close', False, 5.0, 0.1), self._result('fast', True, 2.0, 0.2)]
+
+        ranked = SweepCommand()._rank(results, 'time')
+
+        self.assertEqual([result['name'] for result in ranked], ['fast', 'slow', 'stuck close', 'stuck fast'])
+        self.assertEqual([result['rank'] for result in ranked], [1, 2, 3, 4])
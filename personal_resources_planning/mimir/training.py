@@ -0,0 +1,58 @@
+import logging
+import threading
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class TrainingWorker:
+
+    def __init__(self, neuralNetwork, background = True):
+        self._neuralNetwork = neuralNetwork
+        self._background = background
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='mimir-training') if background else None
+        self._lock = threading.Lock()
+        self._pendingCases = []
+        self._scheduled = False
+
+    def enqueue(self, cases):
+        if not self._background:
+            self._neuralNetwork.learnFromCases(cases)
+            return
+
+        with self._lock:
+            self._pendingCases.extend(cases)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._executor.submit(self._train)
+
+    async def aenqueue(self, cases):
+        # Without the background worker, training still runs in its own thread rather than the shared thread that
+        # sync_to_async uses for the ORM, so async views keep being served meanwhile.
+        if self._background:
+            self.enqueue(cases)
+        else:
+            await sync_to_async(self._learnInThread, thread_sensitive=False)(cases)
+
+    def _learnInThread(self, cases):
+        try:
+            self._neuralNetwork.learnFromCases(cases)
+        finally:
+            connection.close()
+
+    def _train(self):
+        # Feedback queued while a previous run was training is coalesced into this single run.
+        with self._lock:
+            cases = self._pendingCases
+            self._pendingCases = []
+            self._scheduled = False
+
+        try:
+            self._neuralNetwork.learnFromCases(cases)
+        except Exception:
+            logger.exception('Training on %d queued cases failed', len(cases))
+        finally:
+            connection.close()
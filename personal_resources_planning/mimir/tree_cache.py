@@ -0,0 +1,47 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+from mimir.model_sync import ModelGeneration
+from mimir.models import Category
+from mimir.serializers import KnowledgeTreeSerializer
+
+_treeKey = 'mimir:knowledgeTree:{}'
+
+# The generation is shared through a file like the model version, since the cache may be local to each process and
+# writers such as importcards run in processes of their own.
+_sharedGeneration = ModelGeneration(settings.MIMIR_TREE_GENERATION_FILE)
+_generation = None
+
+
+def _treeGeneration():
+    global _generation
+    published = _sharedGeneration.poll()
+    if published is not None:
+        _generation = published
+    elif _generation is None:
+        # Start from a fresh value rather than 1 so a lost generation never revives a stale cached tree.
+        bumpTreeGeneration()
+    return _generation
+
+
+def bumpTreeGeneration():
+    global _generation
+    previous, _generation = _generation, time.time_ns()
+    _sharedGeneration.publish(_generation)
+    if previous is not None:
+        cache.delete(_treeKey.format(previous))
+
+
+def cachedKnowledgeTree():
+    # Returns (etag, data) of the knowledge tree, serializing it only once per tree generation.
+    key = _treeKey.format(_treeGeneration())
+    tree = cache.get(key)
+    if tree is None:
+        data = KnowledgeTreeSerializer(Category.objects.get(id=1)).data
+        etag = '"' + hashlib.sha1(JSONRenderer().render(data)).hexdigest() + '"'
+        tree = (etag, data)
+        # Bounds how long a change that bypassed bumpTreeGeneration (the admin, raw SQL) stays hidden.
+        cache.set(key, tree, timeout=settings.MIMIR_KNOWLEDGE_TREE_CACHE_TIMEOUT)
+    return tree
@@ -1,11 +1,19 @@
+from django.conf import settings
 from django.urls import path
-from mimir import views
+from mimir import async_views, views
+
+api = async_views if settings.MIMIR_ASYNC_VIEWS else views
 
 urlpatterns = [
-    path('knowledgeTree', views.buildKnowledgeTree, name='knowledgeTree'),
-    path('card', views.createCard, name='cardCreate'),
-    path('card/<int:card_id>', views.updateOrDeleteCard, name='cardUpdateOrDelete'),
-    path('category', views.createCategory, name='categoryCreate'),
-    path('category/<int:category_id>', views.updateOrDeleteCategory, name='categoryUpdateOrDelete'),
-    path('review', views.reviewCard, name='reviewCard')
+    path('knowledgeTree', api.buildKnowledgeTree, name='knowledgeTree'),
+    path('card', api.createCard, name='cardCreate'),
+    path('card/<int:card_id>', api.updateOrDeleteCard, name='cardUpdateOrDelete'),
+    path('category', api.createCategory, name='categoryCreate'),
+    path('category/<int:category_id>', api.updateOrDeleteCategory, name='categoryUpdateOrDelete'),
+    path('review', api.reviewCard, name='reviewCard'),
+    path('review/batch', api.reviewCards, name='reviewCards'),
+    path('due', api.dueCards, name='dueCards'),
+    path('sync', api.sync, name='sync'),
+    path('cards/import', views.importCardsStream, name='cardsImport'),
+    path('cards/export', views.exportCards, name='cardsExport')
 ]
\ No newline at end of file
@@ -1,74 +1,140 @@
-from rest_framework import status
+import codecs
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import parse_etags
+from rest_framework import serializers, status
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
-from mimir.neural_network import NeuralNetwork
-from mimir.serializers import CardSerializer, CategorySerializer, ReviewSerializer
-from mimir.models import Card, Category
+from mimir.card_transfer import exportLines, importCards, readRows
+from mimir.model_provider import modelProvider
+from mimir.tree_cache import bumpTreeGeneration, cachedKnowledgeTree
+from mimir.serializers import CardSerializer, CategoryNodeSerializer, CategorySerializer, DueCardsQuerySerializer, \
+    KnowledgeSubtreeSerializer, KnowledgeTreeQuerySerializer, ReviewSerializer, SyncQuerySerializer
+from mimir.models import Card, Category, Tombstone
 from datetime import datetime, timedelta, date
 
 # Create your views here.
-nn = NeuralNetwork()
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def buildKnowledgeTree(request):
-    rootCategory = Category.objects.get(id=1)
-    serializer = CategorySerializer(rootCategory)
+    if _isSubtreeQuery(request.query_params):
+        return _buildKnowledgeSubtree(request)
+
+    etag, data = cachedKnowledgeTree()
+    if _matchesETag(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return Response(data, status=status.HTTP_200_OK, headers={'ETag': etag})
+
+def _isSubtreeQuery(params):
+    # Unrelated query parameters (e.g. cache busters) still get the cached full tree.
+    return any(name in params for name in KnowledgeTreeQuerySerializer().fields)
+
+def _matchesETag(request, etag):
+    ifNoneMatch = [tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))]
+    return etag in ifNoneMatch or '*' in ifNoneMatch
+
+def _validated(serializer):
+    # Invalid data is answered by the exception handler with a 400 holding the serializer errors.
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data
+
+def _buildKnowledgeSubtree(request):
+    query = _validated(KnowledgeTreeQuerySerializer(data=request.query_params))
+    try:
+        category = _subtreeNodes().get(id=query.get('node'))
+    except Category.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    serializer = KnowledgeSubtreeSerializer(category, context=query)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
+def _subtreeNodes():
+    return Category.objects.annotate(childCount=Count('children'))
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def createCard(request):
-    serializer = CardSerializer(data=request.data)
+    return _createCard(request.data)
+
+def _createCard(data):
+    serializer = CardSerializer(data=data)
     if serializer.is_valid():
-        predictedInterval = nn.predictNextInterval(0, 0, 0, 0) # Default grade is 0
+        predictedInterval = modelProvider.neuralNetwork().predictNextInterval(0, 0, 0, 0) # Default grade is 0
         serializer.save(lastPredictedInterval=0,
                         reviewInterval=0,
                         repetition=0,
                         predictedInterval=predictedInterval,
                         nextReviewOn=(date.today() + timedelta(days=predictedInterval)))
+        bumpTreeGeneration()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-@api_view(['PUT', 'DELETE'])
+@api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def updateOrDeleteCard(request, card_id):
     try:
         card = Card.objects.get(id=card_id)
     except Card.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
-    
-    if request.method == 'PUT':
+    return _cardDetail(request, card)
+
+def _cardDetail(request, card):
+    if request.method == 'GET':
+        serializer = CardSerializer(card)
+        return Response(serializer.data)
+    elif request.method == 'PUT':
         serializer = CardSerializer(card, data=request.data)
         if serializer.is_valid():
             serializer.save(updatedOn=datetime.now())
+            bumpTreeGeneration()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     elif request.method == 'DELETE':
-        card.delete()
+        _deleteCard(card)
+        bumpTreeGeneration()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def createCategory(request):
-    serializer = CategorySerializer(data=request.data)
+    return _createCategory(request.data)
+
+def _createCategory(data):
+    serializer = CategorySerializer(data=data)
     if serializer.is_valid():
         serializer.save()
+        bumpTreeGeneration()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-def _removeSubCategoryRecursively(category_id):
-    effectedCategories = Category.objects.filter(parentCategory=category_id)
+@transaction.atomic
+def _deleteCard(card):
+    Tombstone.objects.create(model=Tombstone.CARD, objectId=card.id)
+    card.delete()
 
-    for category in effectedCategories:
-        _removeSubCategoryRecursively(category.id)
-
-        effectedCards = Card.objects.filter(category=category.id)
-        for card in effectedCards:
-            card.delete()
-
-        category.delete()
+@transaction.atomic
+def _removeCategorySubtree(category):
+    # Removes the cards of the category and all of its descendants, then the categories themselves, with one DELETE
+    # each over the category path range. The categories are deleted with raw SQL because the ORM refuses to delete
+    # categories that PROTECT each other; the parent_category foreign key is only checked at commit, when the whole
+    # subtree is gone. Tombstones for everything removed are copied over with INSERT ... SELECT beforehand.
+    subtree = Category.objects.subtreeOf(category)
+    pathRange = Category.objects.pathRange(category)
+    deletedOn = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.execute('INSERT INTO tombstone (model, object_id, deleted_on) '
+                       'SELECT %s, id, %s FROM card WHERE category IN (SELECT id FROM category WHERE path >= %s AND path < %s)',
+                       [Tombstone.CARD, deletedOn, *pathRange])
+        cursor.execute('INSERT INTO tombstone (model, object_id, deleted_on) '
+                       'SELECT %s, id, %s FROM category WHERE path >= %s AND path < %s',
+                       [Tombstone.CATEGORY, deletedOn, *pathRange])
+    Card.objects.filter(category__in=subtree).delete()
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM category WHERE path >= %s AND path < %s', pathRange)
 
 @api_view(['PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
@@ -77,60 +143,184 @@ def updateOrDeleteCategory(request, category_id):
         category = Category.objects.get(id=category_id)
     except Category.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
+    return _categoryDetail(request, category)
 
+def _categoryDetail(request, category):
     if request.method == 'PUT':
         serializer = CategorySerializer(category, data=request.data)
         if serializer.is_valid():
             serializer.save(updatedOn=datetime.now())
+            bumpTreeGeneration()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     elif request.method == 'DELETE':
         # must warn user about deleting all cateories or cards that under this category.
-        # Remove subcategory recursively along side their cards.
-        _removeSubCategoryRecursively(category_id)
+        # Remove the category and its subcategories along side their cards.
+        _removeCategorySubtree(category)
+        bumpTreeGeneration()
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
-        # Remove current category's cards
-        Card.objects.filter(category=category_id).delete()
+def _applyReviews(cards, actualGrades):
+    # The network is retrained once on the feedback of all of the reviews.
+    cases = _recordReviews(modelProvider.neuralNetwork(), cards, actualGrades)
+    bumpTreeGeneration()
+    modelProvider.trainingWorker().enqueue(cases)
 
-        # Then remove the category itself.
-        category.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+def _recordReviews(nn, cards, actualGrades):
+    # Records the feedback of every review, reschedules the cards with one vectorized prediction and saves them with
+    # a single bulk UPDATE. Returns the feedback cases to train on.
+    today = date.today()
+    actualIntervals = [(today - card.lastReviewOn).days for card in cards]
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def reviewCard(request):
-    serializer = ReviewSerializer(data=request.data)
-    if serializer.is_valid():
-        try:
-            card = Card.objects.get(id=serializer.validated_data.get('cardId'))
-
-            nn.feedBackToNeuralNetwork(
-                lastPredictedInterval=card.lastPredictedInterval,
-                reviewInterval=card.reviewInterval,
-                repetition=card.repetition,
-                grade=card.grade,
-                predictedInterval=card.predictedInterval,
-                actualInterval=(date.today() - card.lastReviewOn).days,
-                actualGrade=serializer.validated_data.get('actualGrade')
-            )
-            nextInterval = nn.predictNextInterval(
-                predictedInterval=card.predictedInterval,
-                reviewInterval=(date.today() - card.lastReviewOn).days,
-                repetition=card.repetition + 1,
-                grade=serializer.validated_data.get('actualGrade')
-            )
+    with transaction.atomic():
+        cases = nn.recordFeedbacks([
+            (card.lastPredictedInterval,
+             card.reviewInterval,
+             card.repetition,
+             card.grade,
+             card.predictedInterval,
+             actualInterval,
+             actualGrade)
+            for card, actualInterval, actualGrade in zip(cards, actualIntervals, actualGrades)],
+            cardIds=[card.id for card in cards])
+        nextIntervals = nn.predictNextIntervals(
+            predictedIntervals=[card.predictedInterval for card in cards],
+            reviewIntervals=actualIntervals,
+            repetitions=[card.repetition + 1 for card in cards],
+            grades=actualGrades
+        ).tolist()
+
+        now = datetime.now()
+        for card, actualInterval, actualGrade, nextInterval in zip(cards, actualIntervals, actualGrades, nextIntervals):
             card.lastPredictedInterval = card.predictedInterval
-            card.reviewInterval = (date.today() - card.lastReviewOn).days
+            card.reviewInterval = actualInterval
             card.repetition += 1
-            card.grade = serializer.validated_data.get('actualGrade')
+            card.grade = actualGrade
             card.predictedInterval = nextInterval
 
-            card.nextReviewOn = date.today() + timedelta(days=nextInterval)
-            card.lastReviewOn = date.today()
+            card.nextReviewOn = today + timedelta(days=nextInterval)
+            card.lastReviewOn = today
+
+            card.updatedOn = now
+        Card.objects.bulk_update(cards, ['lastPredictedInterval', 'reviewInterval', 'repetition', 'grade',
+                                         'predictedInterval', 'nextReviewOn', 'lastReviewOn', 'updatedOn'])
+    return cases
 
-            card.updatedOn = datetime.now()
-            card.save()
-            return Response(status=status.HTTP_200_OK)
-        except Card.DoesNotExist:
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def reviewCard(request):
+    review = _validated(ReviewSerializer(data=request.data))
+    try:
+        card = Card.objects.get(id=review.get('cardId'))
+    except Card.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    _applyReviews([card], [review.get('actualGrade')])
+    return Response(status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def reviewCards(request):
+    cardIds, actualGrades = _reviewBatch(request.data)
+    cards = Card.objects.in_bulk(cardIds)
+    missing = _missingCardsResponse(cardIds, cards)
+    if missing is not None:
+        return missing
+
+    _applyReviews([cards[cardId] for cardId in cardIds], actualGrades)
+    return Response(status=status.HTTP_200_OK)
+
+def _reviewBatch(data):
+    # Returns the card ids and grades of a batch of reviews, in which every card is reviewed at most once.
+    reviews = _validated(ReviewSerializer(data=data, many=True, allow_empty=False, max_length=1000))
+    cardIds = [review.get('cardId') for review in reviews]
+    if len(set(cardIds)) != len(cardIds):
+        raise serializers.ValidationError({'cardId': ['A card can only be reviewed once per batch.']})
+    return cardIds, [review.get('actualGrade') for review in reviews]
+
+def _missingCardsResponse(cardIds, cards):
+    missingCardIds = [cardId for cardId in cardIds if cardId not in cards]
+    if missingCardIds:
+        return Response({'missingCardIds': missingCardIds}, status=status.HTTP_404_NOT_FOUND)
+    return None
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def dueCards(request):
+    query = _validated(DueCardsQuerySerializer(data=request.query_params))
+    category = None
+    if 'category' in query:
+        try:
+            category = Category.objects.get(id=query.get('category'))
+        except Category.DoesNotExist:
             return Response(status=status.HTTP_404_NOT_FOUND)
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+
+    limit = query.get('limit')
+    page = list(_dueCards(category, query.get('cursor'))[:limit + 1])
+    return Response(_duePage(page, limit), status=status.HTTP_200_OK)
+
+def _dueCards(category, cursor):
+    # Ordered like the (next_review_on, category) index so a page is a single index range scan.
+    cards = Card.objects.filter(nextReviewOn__lte=date.today()).order_by('nextReviewOn', 'category', 'id')
+    if category is not None:
+        cards = cards.filter(category__in=Category.objects.subtreeOf(category))
+    if cursor is not None:
+        nextReviewOn, category_id, card_id = cursor
+        cards = cards.filter(Q(nextReviewOn__gt=nextReviewOn) |
+                             Q(nextReviewOn=nextReviewOn, category__gt=category_id) |
+                             Q(nextReviewOn=nextReviewOn, category=category_id, id__gt=card_id))
+    return cards
+
+def _duePage(page, limit):
+    # page holds up to limit + 1 cards; the extra card only tells whether there is a next page.
+    nextCursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        last = page[-1]
+        nextCursor = f'{last.nextReviewOn.isoformat()},{last.category_id},{last.id}'
+    return {'cards': CardSerializer(page, many=True).data, 'nextCursor': nextCursor}
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def importCardsStream(request):
+    # The body is read line by line (NDJSON, or CSV with a header line when sent as text/csv) and imported in chunks.
+    format = 'csv' if request.content_type.startswith('text/csv') else 'ndjson'
+    lines = codecs.iterdecode(request.stream, 'utf-8') if request.stream is not None else []
+    created, errors = importCards((row for row in readRows(lines, format)), modelProvider.neuralNetwork())
+    if created:
+        bumpTreeGeneration()
+    return Response({'created': created, 'errors': errors}, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def exportCards(request):
+    response = StreamingHttpResponse(exportLines(), content_type='application/x-ndjson; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="mimir.ndjson"'
+    return response
+
+# Changes made by transactions that commit after a sync started can carry an earlier updatedOn, so the cursor is moved
+# back by this much; clients may get a few rows twice but never miss one.
+SYNC_OVERLAP = timedelta(seconds=5)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sync(request):
+    query = _validated(SyncQuerySerializer(data=request.query_params))
+    return Response(_changesSince(query.get('since')), status=status.HTTP_200_OK)
+
+def _changesSince(since):
+    # Cards and categories created or updated since the cursor (through the updated_on indexes) and the ids of those
+    # deleted since then. The next cursor is taken before querying so nothing changed meanwhile is skipped.
+    cursor = timezone.now() - SYNC_OVERLAP
+    categories = Category.objects.order_by('id')
+    cards = Card.objects.order_by('id')
+    deleted = {Tombstone.CARD: [], Tombstone.CATEGORY: []}
+    if since is not None:
+        categories = categories.filter(updatedOn__gte=since)
+        cards = cards.filter(updatedOn__gte=since)
+        for model, objectId in Tombstone.objects.filter(deletedOn__gte=since).order_by('id').values_list('model', 'objectId'):
+            deleted[model].append(objectId)
+
+    return {'categories': CategoryNodeSerializer(categories, many=True).data,
+            'cards': CardSerializer(cards, many=True).data,
+            'deleted': {'categories': deleted[Tombstone.CATEGORY], 'cards': deleted[Tombstone.CARD]},
+            'cursor': serializers.DateTimeField().to_representation(cursor)}
\ No newline at end of file
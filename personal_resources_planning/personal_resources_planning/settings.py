@@ -84,6 +84,18 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The serialized knowledge tree is cached here. With several worker processes use a shared backend
+# (e.g. Memcached or Redis) so that every process sees the invalidations.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -129,4 +141,76 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ]
-}
\ No newline at end of file
+}
+
+# Mimir scheduling network
+# 'online' trains case by case, 'batch' takes one vectorized gradient step per MIMIR_TRAINING_BATCH_SIZE cases
+# (None steps once over all cases per epoch).
+
+MIMIR_TRAINING_MODE = 'online'
+
+MIMIR_TRAINING_BATCH_SIZE = None
+
+# Retrain after reviews on a background thread instead of inside the /review request.
+
+MIMIR_BACKGROUND_TRAINING = True
+
+# File used to tell every worker process that a new checkpoint became active (None disables cross-process reloads).
+
+MIMIR_MODEL_GENERATION_FILE = BASE_DIR / 'mimir_model.generation'
+
+# File used to tell every process that the knowledge tree changed, so none serves a cached tree of an older generation
+# (None only invalidates the tree within the process that changed it).
+
+MIMIR_TREE_GENERATION_FILE = BASE_DIR / 'mimir_tree.generation'
+
+# Seconds a serialized knowledge tree stays cached, in case it changes without a new generation (None never expires).
+
+MIMIR_KNOWLEDGE_TREE_CACHE_TIMEOUT = 300
+
+# Number of most recent checkpoints kept after each training run, older ones are deleted (None keeps them all).
+# The active checkpoint is always kept; `manage.py checkpoints prune` applies a retention on demand.
+
+MIMIR_CHECKPOINT_RETENTION = 100
+
+# Number of most recent (deduplicated) feedback cases the network is retrained on.
+
+MIMIR_REPLAY_CAPACITY = 101
+
+# How many of those cases are the aggregates of compacted review events (see compactreviewlog) backed by the most
+# reviews; slots without an aggregate hold recent feedback.
+
+MIMIR_REPLAY_AGGREGATE_SLOTS = 25
+
+
+# Route the mimir endpoints to the async views (mimir.async_views); only worth it when served by an ASGI server.
+
+MIMIR_ASYNC_VIEWS = False
+
+# Load the scheduling network on a background thread at startup instead of on the first request that needs it.
+# Every process that sets up Django warms up, management commands included, so enable it for the server only.
+
+MIMIR_WARM_UP_MODEL = False
+
+# Report what mimir logs at INFO and above (e.g. how long loading the scheduling network took) on the console;
+# Django's default logging only shows warnings of app loggers.
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'mimir': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
+# Review events older than this many days are rolled into aggregated training cases by compactreviewlog.
+
+MIMIR_REVIEW_LOG_RETENTION_DAYS = 90
\ No newline at end of file